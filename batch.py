@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+
+# Run a provisioning plan as a dependency DAG in one process.
+#
+# A plan is a YAML (or JSON) file:
+#
+#   concurrency: 8
+#   steps:
+#     - id: base
+#       op: create-snapshot
+#       args: {vcpus: 2, memory: 4096, disk_size: 50000}
+#     - id: web
+#       op: create-instance
+#       args: {snapshot_id: "${base.id}", wait_for: ssh}
+#     - id: setup
+#       op: exec
+#       args: {instance_id: "${web.id}", command: "apt-get update"}
+#     - id: teardown
+#       op: stop
+#       args: {instance_id: "${web.id}"}
+#       needs: [setup]
+#
+# Dependencies come from "needs" and from ${step.attribute} references.
+# Independent steps run concurrently under the plan's concurrency cap, and a
+# failed step cancels everything that depends on it.
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import re
+import time
+
+import yaml
+
+import tracing
+
+_REFERENCE = re.compile(r'\$\{([A-Za-z0-9_-]+)((?:\.[A-Za-z0-9_]+)*)\}')
+
+PENDING, RUNNING, SUCCEEDED, FAILED, CANCELLED = 'pending', 'running', 'succeeded', 'failed', 'cancelled'
+
+
+class PlanError(ValueError):
+    """Raised when a plan file is invalid"""
+
+
+def _run_exec(manager, instance_id, command):
+    result = manager.exec_command(instance_id, command)
+    if result is not None and getattr(result, 'exit_code', 0) != 0:
+        raise RuntimeError(f"command exited with {result.exit_code}")
+    return result
+
+
+def _run_delete(manager, instance_id=None, snapshot_id=None):
+    if instance_id:
+        return manager.delete_instance(instance_id)
+    if snapshot_id:
+        return manager.delete_snapshot(snapshot_id)
+    raise PlanError("delete needs instance_id or snapshot_id")
+
+
+# Plan operation name -> callable(manager, **args)
+OPERATIONS = {
+    'create-snapshot': lambda manager, **args: manager.create_snapshot(**args),
+    # A step that never reaches its wait_for level fails, so dependents are cancelled
+    'create-instance': lambda manager, **args: manager.create_instance(require_ready=True, **args),
+    'start-instance': lambda manager, **args: manager.start_instance(require_ready=True, **args),
+    'exec': _run_exec,
+    'stop': lambda manager, instance_id: manager.stop_instance(instance_id),
+    'delete': _run_delete,
+    'delete-snapshot': lambda manager, snapshot_id: manager.delete_snapshot(snapshot_id),
+}
+
+
+class Step:
+    """
+    One operation in a plan and its execution record.
+    """
+
+    def __init__(self, step_id, op, args=None, needs=None):
+        self.id = step_id
+        self.op = op
+        self.args = args or {}
+        self.needs = set(needs or [])
+        self.state = PENDING
+        self.result = None
+        self.error = None
+        self.start = None
+        self.end = None
+
+    @property
+    def duration(self):
+        if self.start is None or self.end is None:
+            return 0.0
+        return self.end - self.start
+
+
+def _references(value):
+    """Yield step IDs referenced anywhere inside an argument value"""
+    if isinstance(value, str):
+        for match in _REFERENCE.finditer(value):
+            yield match.group(1)
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from _references(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from _references(item)
+
+
+def load_plan(path):
+    """
+    Parse and validate a plan file.
+
+    Args:
+        path (str): Path to the YAML or JSON plan
+
+    Returns:
+        A (steps, concurrency) tuple; steps is a dict of step ID to Step in file order
+    """
+    with open(path) as f:
+        data = yaml.safe_load(f) or {}
+
+    steps = {}
+    for index, entry in enumerate(data.get('steps') or []):
+        step_id = str(entry.get('id') or f"step{index + 1}")
+        op = entry.get('op')
+        if op not in OPERATIONS:
+            raise PlanError(f"Step {step_id}: unknown op {op!r} (expected one of {', '.join(OPERATIONS)})")
+        if step_id in steps:
+            raise PlanError(f"Duplicate step id: {step_id}")
+        step = Step(step_id, op, entry.get('args'), entry.get('needs'))
+        step.needs.update(_references(step.args))
+        steps[step_id] = step
+
+    if not steps:
+        raise PlanError("Plan has no steps")
+
+    for step in steps.values():
+        unknown = step.needs - set(steps)
+        if unknown:
+            raise PlanError(f"Step {step.id} depends on unknown step(s): {', '.join(sorted(unknown))}")
+
+    # Reject cycles up front rather than deadlocking at run time
+    visiting, done = set(), set()
+
+    def _visit(step_id, path):
+        if step_id in done:
+            return
+        if step_id in visiting:
+            raise PlanError(f"Dependency cycle: {' -> '.join(path + [step_id])}")
+        visiting.add(step_id)
+        for dependency in steps[step_id].needs:
+            _visit(dependency, path + [step_id])
+        visiting.discard(step_id)
+        done.add(step_id)
+
+    for step_id in steps:
+        _visit(step_id, [])
+
+    return steps, int(data.get('concurrency', 4))
+
+
+def _lookup(steps, step_id, attributes):
+    value = steps[step_id].result
+    for attribute in attributes.split('.')[1:] if attributes else []:
+        value = value[attribute] if isinstance(value, dict) else getattr(value, attribute)
+    return value
+
+
+def resolve(value, steps):
+    """
+    Substitute ${step.attribute} references with values from finished steps.
+    A string that is exactly one reference keeps the referenced value's type.
+    """
+    if isinstance(value, str):
+        match = _REFERENCE.fullmatch(value)
+        if match:
+            return _lookup(steps, match.group(1), match.group(2))
+        return _REFERENCE.sub(lambda m: str(_lookup(steps, m.group(1), m.group(2))), value)
+    if isinstance(value, dict):
+        return {key: resolve(item, steps) for key, item in value.items()}
+    if isinstance(value, list):
+        return [resolve(item, steps) for item in value]
+    return value
+
+
+class BatchRunner:
+    """
+    Executes a plan's steps as a DAG with a global concurrency cap.
+    """
+
+    def __init__(self, manager, steps, concurrency=4):
+        self.manager = manager
+        self.steps = steps
+        self.concurrency = max(1, concurrency)
+        self.started = None
+        self.finished = None
+
+    def _execute(self, step):
+        # Time from when a worker picks the step up, not from when it was queued
+        step.start = time.monotonic()
+        print(f"[batch] {step.id}: starting {step.op}")
+        try:
+            with tracing.span("batch.step", step=step.id, op=step.op):
+                args = resolve(step.args, self.steps)
+                result = OPERATIONS[step.op](self.manager, **args)
+                # Manager methods report failures by returning None/False
+                if result is None or result is False:
+                    raise RuntimeError(f"{step.op} failed")
+                return result
+        finally:
+            step.end = time.monotonic()
+
+    def _cancel_dependents(self, failed_id):
+        for step in self.steps.values():
+            if step.state == PENDING and failed_id in step.needs:
+                step.state = CANCELLED
+                step.error = f"dependency {failed_id} did not succeed"
+                self._cancel_dependents(step.id)
+
+    @tracing.traced("BatchRunner.run")
+    def run(self):
+        """
+        Run every step whose dependencies succeeded.
+
+        Returns:
+            True if all steps succeeded
+        """
+        self.started = time.monotonic()
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            while True:
+                for step in self.steps.values():
+                    if step.state != PENDING:
+                        continue
+                    if all(self.steps[dependency].state == SUCCEEDED for dependency in step.needs):
+                        step.state = RUNNING
+                        running[executor.submit(tracing.bind_context(self._execute), step)] = step
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    step = running.pop(future)
+                    try:
+                        step.result = future.result()
+                        step.state = SUCCEEDED
+                        print(f"[batch] {step.id}: succeeded in {step.duration:.2f}s")
+                    except Exception as e:
+                        step.state = FAILED
+                        step.error = str(e)
+                        print(f"[batch] {step.id}: FAILED after {step.duration:.2f}s - {e}")
+                        self._cancel_dependents(step.id)
+        self.finished = time.monotonic()
+        return all(step.state == SUCCEEDED for step in self.steps.values())
+
+    def critical_path(self):
+        """
+        The chain of steps that determined the total run time: start from the
+        step that finished last and repeatedly follow the dependency that finished last.
+
+        Returns:
+            List of Step objects from first to last
+        """
+        finished = [step for step in self.steps.values() if step.end is not None]
+        if not finished:
+            return []
+        path = [max(finished, key=lambda step: step.end)]
+        while True:
+            dependencies = [self.steps[dependency] for dependency in path[-1].needs
+                            if self.steps[dependency].end is not None]
+            if not dependencies:
+                break
+            path.append(max(dependencies, key=lambda step: step.end))
+        return list(reversed(path))
+
+    def print_summary(self):
+        """Print per-step timing and the critical path"""
+        total = (self.finished or time.monotonic()) - (self.started or time.monotonic())
+        print(f"\nBatch summary ({total:.2f}s wall clock, concurrency {self.concurrency}):")
+        print(f"{'STEP':<24} {'OP':<16} {'STATE':<10} {'START':>8} {'DURATION':>9}")
+        for step in self.steps.values():
+            offset = f"{step.start - self.started:.2f}" if step.start is not None else '-'
+            duration = f"{step.duration:.2f}" if step.end is not None else '-'
+            print(f"{step.id:<24} {step.op:<16} {step.state:<10} {offset:>8} {duration:>9}")
+            if step.error and step.state != SUCCEEDED:
+                print(f"{'':<24} {step.error}")
+
+        path = self.critical_path()
+        if path:
+            serial = sum(step.duration for step in self.steps.values())
+            print(f"\nCritical path ({sum(step.duration for step in path):.2f}s of {serial:.2f}s serial work):")
+            print("  " + " -> ".join(f"{step.id} ({step.duration:.2f}s)" for step in path))
+
+
+def print_plan(steps):
+    """Print the plan's execution levels without running anything"""
+    levels = {}
+
+    def _level(step_id):
+        if step_id not in levels:
+            needs = steps[step_id].needs
+            levels[step_id] = 1 + max((_level(dependency) for dependency in needs), default=-1)
+        return levels[step_id]
+
+    for step_id in steps:
+        _level(step_id)
+    for level in range(max(levels.values()) + 1):
+        names = [f"{step_id} ({steps[step_id].op})" for step_id in steps if levels[step_id] == level]
+        print(f"Level {level}: {', '.join(names)}")
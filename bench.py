@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+
+# Boot-latency benchmark across snapshot shapes.
+#
+# Every combination of the vCPU/memory/disk grid gets its own snapshot, created
+# in parallel. Several instances are then booted from each snapshot and timed
+# to "running", to SSH readiness and, optionally, through a workload command
+# run inside the instance. Everything is torn down afterwards and the shapes are
+# compared by mean and 95% confidence interval.
+#
+# FakeMorphClient stands in for MorphCloudClient so the harness itself can be
+# exercised locally without an account.
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import asyncio
+import itertools
+import json
+import os
+import random
+import socketserver
+import statistics
+import threading
+import time
+import types
+import uuid
+
+import readiness
+import tracing
+
+# Two-sided 95% Student's t critical values by degrees of freedom
+_T95 = {1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306, 9: 2.262,
+        10: 2.228, 12: 2.179, 15: 2.131, 20: 2.086, 25: 2.060, 30: 2.042}
+
+METRICS = ('running', 'ssh', 'workload')
+
+
+class Shape:
+    """One vCPU/memory/disk combination"""
+
+    def __init__(self, vcpus, memory, disk_size):
+        self.vcpus = vcpus
+        self.memory = memory
+        self.disk_size = disk_size
+
+    @property
+    def label(self):
+        return f"{self.vcpus}cpu/{self.memory}MB/{self.disk_size}MB"
+
+    def to_dict(self):
+        return {'vcpus': self.vcpus, 'memory': self.memory, 'disk_size': self.disk_size}
+
+
+def _int_list(value):
+    return [int(item) for item in str(value).split(',') if item.strip()]
+
+
+def parse_grid(vcpus, memory, disk_size):
+    """
+    Expand comma-separated value lists into every combination.
+
+    Args:
+        vcpus (str): e.g. "1,2,4"
+        memory (str): Memory values in MB, e.g. "2048,4096"
+        disk_size (str): Disk values in MB, e.g. "20000"
+
+    Returns:
+        List of Shape objects
+    """
+    grid = itertools.product(_int_list(vcpus), _int_list(memory), _int_list(disk_size))
+    return [Shape(*values) for values in grid]
+
+
+def confidence_interval(samples):
+    """
+    Mean and 95% confidence half-width of a sample (Student's t).
+
+    Returns:
+        A (mean, half_width) tuple; half_width is None with fewer than two samples
+    """
+    if not samples:
+        return None, None
+    mean = statistics.mean(samples)
+    if len(samples) < 2:
+        return mean, None
+    df = len(samples) - 1
+    t = _T95[max(key for key in _T95 if key <= df)] if df <= 30 else 1.96
+    return mean, t * statistics.stdev(samples) / len(samples) ** 0.5
+
+
+class BootSample:
+    """Timings of one instance boot, in seconds from the start call"""
+
+    def __init__(self, shape):
+        self.shape = shape
+        self.instance_id = None
+        self.running = None
+        self.ssh = None
+        self.workload = None
+        self.error = None
+
+    def to_dict(self):
+        return {'shape': self.shape.to_dict(), 'instance_id': self.instance_id, 'running': self.running,
+                'ssh': self.ssh, 'workload': self.workload, 'error': self.error}
+
+
+class ShapeBench:
+    """
+    Creates one snapshot per shape, boots and times instances from them, and cleans up.
+    """
+
+    def __init__(self, manager, shapes, runs=3, workload=None, timeout=300, interval=0.1,
+                 concurrency=16, ssh_endpoint=None):
+        self.manager = manager
+        self.shapes = shapes
+        self.runs = runs
+        self.workload = workload
+        self.timeout = timeout
+        self.interval = interval
+        self.concurrency = max(1, concurrency)
+        self.ssh_endpoint = ssh_endpoint
+        self.snapshots = {}
+        self.snapshot_seconds = {}
+        self.samples = []
+        self._token = uuid.uuid4().hex[:8]
+        self._random = random.Random()
+
+    def _create_snapshot(self, shape):
+        started = time.monotonic()
+        snapshot = self.manager.create_snapshot(vcpus=shape.vcpus, memory=shape.memory, disk_size=shape.disk_size,
+                                                digest=f"bench-{shape.vcpus}-{shape.memory}-{shape.disk_size}-{self._token}")
+        if snapshot is None:
+            raise RuntimeError(f"could not create a snapshot for {shape.label}")
+        return snapshot, time.monotonic() - started
+
+    def _create_snapshots(self):
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(self.shapes))) as executor:
+            futures = {executor.submit(tracing.bind_context(self._create_snapshot), shape): shape
+                       for shape in self.shapes}
+            for future in as_completed(futures):
+                shape = futures[future]
+                try:
+                    self.snapshots[shape], self.snapshot_seconds[shape] = future.result()
+                except Exception as e:
+                    print(f"[bench] {shape.label}: {e}")
+
+    async def _wait(self, instance, probes, timeout, not_ready_at):
+        """
+        Wait for readiness and estimate when the instance became ready.
+        
+        The transition happened between the last failed poll and the first passing
+        one, so the midpoint of that bracket is reported rather than the poll time.
+        The first poll is delayed by a random fraction of the interval; otherwise
+        every boot is sampled on the same grid and repeated runs report identical times.
+
+        Returns:
+            A (ProbeResult, ready_at) tuple; ready_at is a time.monotonic() value
+        """
+        bracket = [not_ready_at]
+
+        def _note(instance_id, attempt, error):
+            if error is not None:
+                bracket[0] = time.monotonic()
+
+        await asyncio.sleep(self._random.uniform(0, self.interval))
+        result = await readiness.wait_ready(instance, probes, timeout=timeout, interval=self.interval,
+                                            on_attempt=_note)
+        return result, (bracket[0] + time.monotonic()) / 2
+
+    def _ssh_probes(self):
+        host, port = self.ssh_endpoint or (None, None)
+        return [readiness.SshBannerProbe(host=host, port=port), readiness.CommandProbe('true')]
+
+    async def _boot(self, shape, semaphore):
+        sample = BootSample(shape)
+        client = self.manager.client
+        async with semaphore:
+            instance = None
+            try:
+                with tracing.span("bench.boot", shape=shape.label):
+                    started = time.monotonic()
+                    instance = await asyncio.to_thread(client.instances.start, snapshot_id=self.snapshots[shape].id)
+                    sample.instance_id = instance.id
+                    self.manager._record('instance', instance.id, parent_id=self.snapshots[shape].id)
+
+                    result, ready_at = await self._wait(instance, [readiness.StatusProbe(client)],
+                                                        self.timeout, started)
+                    if not result.ok:
+                        raise RuntimeError(f"not running: {result.error}")
+                    sample.running = ready_at - started
+
+                    running_seen = time.monotonic()
+                    remaining = max(self.timeout - (running_seen - started), self.interval)
+                    result, ready_at = await self._wait(result.instance, self._ssh_probes(), remaining, running_seen)
+                    if not result.ok:
+                        raise RuntimeError(f"not SSH-ready: {result.error}")
+                    # SSH cannot be ready before the instance is running
+                    sample.ssh = max(ready_at - started, sample.running)
+
+                    if self.workload:
+                        workload_started = time.monotonic()
+                        output = await asyncio.to_thread(result.instance.exec, self.workload)
+                        if getattr(output, 'exit_code', 0) != 0:
+                            raise RuntimeError(f"workload exited with {output.exit_code}")
+                        sample.workload = time.monotonic() - workload_started
+            except Exception as e:
+                sample.error = str(e)
+            finally:
+                if instance is not None:
+                    try:
+                        await asyncio.to_thread(instance.stop)
+                        self.manager._forget(instance.id)
+                    except Exception as e:
+                        print(f"[bench] could not stop {instance.id}: {e}")
+        state = f"running {sample.running:.2f}s, ssh {sample.ssh:.2f}s" if sample.error is None else sample.error
+        print(f"[bench] {shape.label} {sample.instance_id}: {state}")
+        return sample
+
+    async def _boot_all(self):
+        # Start calls, workloads and stops block a thread each; size the pool so they never queue behind each other
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=self.concurrency * 2 + 4))
+        semaphore = asyncio.Semaphore(self.concurrency)
+        boots = [self._boot(shape, semaphore) for shape in self.shapes if shape in self.snapshots
+                 for _ in range(self.runs)]
+        return await asyncio.gather(*boots)
+
+    def _cleanup(self):
+        for shape, snapshot in self.snapshots.items():
+            self.manager.delete_snapshot(snapshot.id)
+
+    @tracing.traced("ShapeBench.run")
+    def run(self):
+        """
+        Returns:
+            List of BootSample objects
+        """
+        try:
+            print(f"[bench] Creating {len(self.shapes)} snapshots...")
+            self._create_snapshots()
+            print(f"[bench] Booting {self.runs} instances per shape (at most {self.concurrency} at once)...")
+            self.samples = asyncio.run(self._boot_all())
+        finally:
+            self._cleanup()
+        return self.samples
+
+    @property
+    def resolution(self):
+        """Half the poll interval: readiness times are only known to within this much"""
+        return self.interval / 2
+
+    def summary(self):
+        """
+        Per-shape statistics.
+
+        Readiness half-widths are never narrower than the poll resolution, however
+        consistent the samples look.
+
+        Returns:
+            List of dicts with shape, ok/failed counts, snapshot_seconds and a
+            (mean, half_width) tuple per metric
+        """
+        rows = []
+        for shape in self.shapes:
+            samples = [sample for sample in self.samples if sample.shape is shape]
+            ok = [sample for sample in samples if sample.error is None]
+            row = {'shape': shape, 'ok': len(ok), 'failed': len(samples) - len(ok),
+                   'snapshot_seconds': self.snapshot_seconds.get(shape)}
+            for metric in METRICS:
+                mean, half_width = confidence_interval([getattr(sample, metric) for sample in ok
+                                                        if getattr(sample, metric) is not None])
+                if half_width is not None and metric != 'workload':
+                    half_width = max(half_width, self.resolution)
+                row[metric] = (mean, half_width)
+            rows.append(row)
+        return rows
+
+    def print_table(self):
+        """Print the shapes side by side, fastest time-to-SSH first"""
+        def _cell(stat):
+            mean, half_width = stat
+            if mean is None:
+                return '-'
+            return f"{mean:.2f}" if half_width is None else f"{mean:.2f} ± {half_width:.2f}"
+
+        rows = sorted(self.summary(), key=lambda row: row['ssh'][0] if row['ssh'][0] is not None else float('inf'))
+        print(f"\n{'SHAPE':<24} {'OK':>4} {'FAIL':>4} {'SNAPSHOT':>9} {'RUNNING (s)':>16} {'SSH (s)':>16} {'WORKLOAD (s)':>16}")
+        for row in rows:
+            snapshot = f"{row['snapshot_seconds']:.2f}" if row['snapshot_seconds'] is not None else '-'
+            print(f"{row['shape'].label:<24} {row['ok']:>4} {row['failed']:>4} {snapshot:>9} "
+                  f"{_cell(row['running']):>16} {_cell(row['ssh']):>16} {_cell(row['workload']):>16}")
+        print(f"Values are means with 95% confidence intervals; readiness is polled every {self.interval:g}s, "
+              f"so RUNNING and SSH are resolved to ±{self.resolution:.2f}s at best")
+
+    def write_json(self, path):
+        """Write the raw samples and summary to a JSON file"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        summary = [{'shape': row['shape'].to_dict(), 'ok': row['ok'], 'failed': row['failed'],
+                    'snapshot_seconds': row['snapshot_seconds'],
+                    **{metric: {'mean': row[metric][0], 'ci95': row[metric][1]} for metric in METRICS}}
+                   for row in self.summary()]
+        with open(path, 'w') as f:
+            json.dump({'samples': [sample.to_dict() for sample in self.samples], 'summary': summary,
+                       'resolution': self.resolution}, f, indent=1)
+
+
+class _BannerHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        self.request.sendall(b'SSH-2.0-FakeMorph\r\n')
+
+
+class _BannerServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _FakeInstance:
+    """Instance whose state follows a simulated boot timeline"""
+
+    def __init__(self, backend, snapshot):
+        self._backend = backend
+        self.id = f"morphvm_{uuid.uuid4().hex[:12]}"
+        self.refs = types.SimpleNamespace(snapshot_id=snapshot.id)
+        self.networking = types.SimpleNamespace(external_ip='127.0.0.1')
+        self.created = int(time.time())
+        self.vcpus = snapshot.vcpus
+        self._started = time.monotonic()
+        self._running_at, self._ssh_at = backend._boot_delays(snapshot)
+        self._stopped = False
+
+    @property
+    def status(self):
+        if self._stopped:
+            return 'stopped'
+        return 'running' if time.monotonic() - self._started >= self._running_at else 'pending'
+
+    def exec(self, command):
+        if time.monotonic() - self._started < self._ssh_at:
+            return types.SimpleNamespace(exit_code=255, stdout='', stderr='sshd not ready')
+        if command != 'true':
+            # Workloads are treated as CPU-bound: more vCPUs, shorter runtime
+            time.sleep(self._backend.workload_seconds / self.vcpus / self._backend.speed)
+        return types.SimpleNamespace(exit_code=0, stdout='', stderr='')
+
+    def stop(self):
+        self._stopped = True
+        self._backend.instances._remove(self.id)
+
+
+class _FakeInstances:
+    def __init__(self, backend):
+        self._backend = backend
+        self._lock = threading.Lock()
+        self._instances = {}
+
+    def start(self, snapshot_id, **kwargs):
+        snapshot = self._backend.snapshots.get(snapshot_id=snapshot_id)
+        time.sleep(self._backend.api_latency / self._backend.speed)
+        instance = _FakeInstance(self._backend, snapshot)
+        with self._lock:
+            self._instances[instance.id] = instance
+        return instance
+
+    def get(self, instance_id):
+        with self._lock:
+            if instance_id not in self._instances:
+                raise KeyError(f"instance {instance_id} not found")
+            return self._instances[instance_id]
+
+    def list(self):
+        with self._lock:
+            return list(self._instances.values())
+
+    def _remove(self, instance_id):
+        with self._lock:
+            self._instances.pop(instance_id, None)
+
+
+class _FakeSnapshots:
+    def __init__(self, backend):
+        self._backend = backend
+        self._lock = threading.Lock()
+        self._snapshots = {}
+
+    def create(self, vcpus=2, memory=4096, disk_size=50000, digest=None):
+        # Larger disks take longer to materialize
+        time.sleep((self._backend.api_latency + disk_size / 100000) / self._backend.speed)
+        snapshot = types.SimpleNamespace(id=f"snapshot_{uuid.uuid4().hex[:12]}", created=int(time.time()),
+                                         vcpus=vcpus, memory=memory, disk_size=disk_size, digest=digest,
+                                         status='ready')
+        with self._lock:
+            self._snapshots[snapshot.id] = snapshot
+        return snapshot
+
+    def get(self, snapshot_id):
+        with self._lock:
+            if snapshot_id not in self._snapshots:
+                raise KeyError(f"snapshot {snapshot_id} not found")
+            return self._snapshots[snapshot_id]
+
+    def list(self):
+        with self._lock:
+            return list(self._snapshots.values())
+
+    def delete(self, snapshot_id):
+        with self._lock:
+            self._snapshots.pop(snapshot_id, None)
+
+
+class FakeMorphClient:
+    """
+    In-process stand-in for MorphCloudClient with simulated boot latencies.
+
+    Time to "running" grows with memory and time to SSH readiness with disk size,
+    both with random jitter. A local server answers SSH banner probes at ssh_endpoint.
+
+    Args:
+        speed (float): Divides every simulated delay (20 = twenty times faster than modelled)
+        seed (int, optional): Seed for reproducible jitter
+        workload_seconds (float): Simulated workload runtime on one vCPU
+    """
+
+    def __init__(self, speed=1.0, seed=None, workload_seconds=4.0, api_latency=0.2):
+        self.speed = speed
+        self.workload_seconds = workload_seconds
+        self.api_latency = api_latency
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self.snapshots = _FakeSnapshots(self)
+        self.instances = _FakeInstances(self)
+        self._server = _BannerServer(('127.0.0.1', 0), _BannerHandler)
+        self.ssh_endpoint = self._server.server_address
+        threading.Thread(target=self._server.serve_forever, name='fake-sshd', daemon=True).start()
+
+    def _boot_delays(self, snapshot):
+        with self._random_lock:
+            jitter = self._random.uniform(0.8, 1.2), self._random.uniform(0.8, 1.2)
+        running = (1.5 + snapshot.memory / 8192) * jitter[0]
+        ssh = running + (1.0 + snapshot.disk_size / 50000) * jitter[1]
+        return running / self.speed, ssh / self.speed
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
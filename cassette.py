@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+
+# Record and replay Morph Cloud API traffic.
+# MorphCloudClient talks to the API through httpx, so recording wraps the
+# client's httpx transport: every request/response pair is written to a
+# gzipped JSON-lines cassette together with its original latency, and replay
+# serves those responses locally at original speed or time-compressed.
+
+import asyncio
+import base64
+import gzip
+import hashlib
+import json
+import threading
+import time
+
+import httpx
+
+CASSETTE_VERSION = 1
+
+# Headers that are either reconstructed by httpx or no longer valid once the body is decoded
+_DROPPED_RESPONSE_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding', 'connection', 'date'}
+
+
+class CassetteMiss(Exception):
+    """Raised when replay finds no recorded response for a request"""
+
+
+def _request_key(client_label, request):
+    """Identify a request by client, method, path/query and body digest"""
+    body = request.content or b''
+    digest = hashlib.sha1(body).hexdigest()[:12] if body else ''
+    return f"{client_label} {request.method} {request.url.raw_path.decode()} {digest}"
+
+
+def _replayable_headers(headers):
+    """Drop headers that would be wrong for an already-decoded body"""
+    return {name: value for name, value in headers.items() if name.lower() not in _DROPPED_RESPONSE_HEADERS}
+
+
+def _encode_body(content):
+    try:
+        return {'text': content.decode('utf-8')}
+    except UnicodeDecodeError:
+        return {'b64': base64.b64encode(content).decode('ascii')}
+
+
+def _decode_body(entry):
+    if 'b64' in entry:
+        return base64.b64decode(entry['b64'])
+    return entry.get('text', '').encode('utf-8')
+
+
+class Recorder:
+    """
+    Collects exchanges from every instrumented client and writes them to a cassette.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.started = time.monotonic()
+        self.exchanges = []
+        self._lock = threading.Lock()
+
+    def add(self, client_label, request, response, content, started, duration):
+        entry = {
+            'key': _request_key(client_label, request),
+            'client': client_label,
+            'method': request.method,
+            'url': request.url.raw_path.decode(),
+            'offset': round(started - self.started, 6),
+            'duration': round(duration, 6),
+            'status': response.status_code,
+            'headers': _replayable_headers(response.headers),
+        }
+        entry.update(_encode_body(content))
+        with self._lock:
+            self.exchanges.append(entry)
+
+    def save(self):
+        """Write the cassette, ordered by request start time"""
+        with self._lock:
+            exchanges = sorted(self.exchanges, key=lambda entry: entry['offset'])
+        with gzip.open(self.path, 'wt') as f:
+            header = {'version': CASSETTE_VERSION, 'recorded_at': time.time(), 'exchanges': len(exchanges)}
+            f.write(json.dumps(header) + '\n')
+            for entry in exchanges:
+                f.write(json.dumps(entry, separators=(',', ':')) + '\n')
+        print(f"Recorded {len(exchanges)} API exchanges to {self.path}")
+
+
+class Player:
+    """
+    Serves recorded responses. Requests with the same key are answered in
+    recording order, so repeated status polls replay the original sequence.
+    """
+
+    def __init__(self, path, speed=1.0):
+        self.path = path
+        self.speed = speed
+        self.served = 0
+        self.misses = 0
+        self.recorded_time = 0.0
+        self._queues = {}
+        self._last = {}
+        self._lock = threading.Lock()
+
+        with gzip.open(path, 'rt') as f:
+            header = json.loads(f.readline())
+            if header.get('version') != CASSETTE_VERSION:
+                raise ValueError(f"Unsupported cassette version: {header.get('version')}")
+            for line in f:
+                entry = json.loads(line)
+                self._queues.setdefault(entry['key'], []).append(entry)
+                self.recorded_time = max(self.recorded_time, entry['offset'] + entry['duration'])
+
+    def next_entry(self, client_label, request):
+        key = _request_key(client_label, request)
+        with self._lock:
+            queue = self._queues.get(key)
+            if queue:
+                entry = queue.pop(0)
+                self._last[key] = entry
+            elif key in self._last:
+                # Polled more often than during recording; keep answering with the final state
+                entry = self._last[key]
+            else:
+                self.misses += 1
+                raise CassetteMiss(f"No recorded response for {key}")
+            self.served += 1
+        return entry
+
+    def delay(self, entry):
+        """Seconds to wait before answering, scaled by the replay speed (0 means no delay)"""
+        if not self.speed:
+            return 0.0
+        return entry['duration'] / self.speed
+
+    def build_response(self, entry, request):
+        return httpx.Response(entry['status'], headers=entry['headers'],
+                              content=_decode_body(entry), request=request)
+
+
+class RecordingTransport(httpx.BaseTransport):
+    """httpx transport that forwards requests and records each exchange"""
+
+    def __init__(self, inner, recorder, client_label):
+        self.inner = inner
+        self.recorder = recorder
+        self.client_label = client_label
+
+    def handle_request(self, request):
+        started = time.monotonic()
+        response = self.inner.handle_request(request)
+        content = response.read()
+        duration = time.monotonic() - started
+        response.close()
+        self.recorder.add(self.client_label, request, response, content, started, duration)
+        return httpx.Response(response.status_code, headers=_replayable_headers(response.headers),
+                              content=content, request=request, extensions=response.extensions)
+
+    def close(self):
+        self.inner.close()
+
+
+class AsyncRecordingTransport(httpx.AsyncBaseTransport):
+    """Async counterpart of RecordingTransport"""
+
+    def __init__(self, inner, recorder, client_label):
+        self.inner = inner
+        self.recorder = recorder
+        self.client_label = client_label
+
+    async def handle_async_request(self, request):
+        started = time.monotonic()
+        response = await self.inner.handle_async_request(request)
+        content = await response.aread()
+        duration = time.monotonic() - started
+        await response.aclose()
+        self.recorder.add(self.client_label, request, response, content, started, duration)
+        return httpx.Response(response.status_code, headers=_replayable_headers(response.headers),
+                              content=content, request=request, extensions=response.extensions)
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+
+class ReplayTransport(httpx.BaseTransport):
+    """httpx transport answering from a cassette without touching the network"""
+
+    def __init__(self, player, client_label):
+        self.player = player
+        self.client_label = client_label
+
+    def handle_request(self, request):
+        entry = self.player.next_entry(self.client_label, request)
+        delay = self.player.delay(entry)
+        if delay:
+            time.sleep(delay)
+        return self.player.build_response(entry, request)
+
+
+class AsyncReplayTransport(httpx.AsyncBaseTransport):
+    """Async counterpart of ReplayTransport"""
+
+    def __init__(self, player, client_label):
+        self.player = player
+        self.client_label = client_label
+
+    async def handle_async_request(self, request):
+        entry = self.player.next_entry(self.client_label, request)
+        delay = self.player.delay(entry)
+        if delay:
+            await asyncio.sleep(delay)
+        return self.player.build_response(entry, request)
+
+
+class Cassette:
+    """
+    A record or replay session shared by every client it is installed into.
+
+    Usage:
+        cassette = Cassette.record("data/rollout.cassette.gz")
+        cassette.install(client)
+        ...
+        cassette.close()
+    """
+
+    def __init__(self, mode, path, speed=1.0):
+        if mode not in ('record', 'replay'):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.mode = mode
+        self.path = path
+        self.started = time.monotonic()
+        self.recorder = Recorder(path) if mode == 'record' else None
+        self.player = Player(path, speed) if mode == 'replay' else None
+
+    @classmethod
+    def record(cls, path):
+        return cls('record', path)
+
+    @classmethod
+    def replay(cls, path, speed=1.0):
+        return cls('replay', path, speed)
+
+    def install(self, client, label='default'):
+        """
+        Route a MorphCloudClient's HTTP traffic through this cassette.
+
+        Args:
+            client: A MorphCloudClient, or a wrapper exposing it as __wrapped__
+            label (str): Name distinguishing clients of different accounts
+        """
+        client = getattr(client, '__wrapped__', client)
+        http_client = getattr(client, '_http_client', None)
+        if http_client is None:
+            raise ValueError("Client does not expose an httpx client to record or replay")
+
+        if self.mode == 'record':
+            http_client._transport = RecordingTransport(http_client._transport, self.recorder, label)
+        else:
+            http_client._transport = ReplayTransport(self.player, label)
+
+        async_client = getattr(client, '_async_http_client', None)
+        if async_client is not None:
+            if self.mode == 'record':
+                async_client._transport = AsyncRecordingTransport(async_client._transport, self.recorder, label)
+            else:
+                async_client._transport = AsyncReplayTransport(self.player, label)
+
+    def close(self):
+        """Save a recording, or print a replay summary"""
+        elapsed = time.monotonic() - self.started
+        if self.recorder:
+            self.recorder.save()
+        else:
+            player = self.player
+            print(f"Replayed {player.served} API exchanges ({player.misses} misses) in {elapsed:.2f}s; "
+                  f"recorded session took {player.recorded_time:.2f}s")
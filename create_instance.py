@@ -5,6 +5,8 @@ import os
 import sys
 import time
 
+from ledger import Ledger
+
 def create_instance(snapshot_id, name=None):
     """
     Create a new instance from a snapshot.
@@ -35,6 +37,10 @@ def create_instance(snapshot_id, name=None):
         )
         
         print(f"Instance created with ID: {instance.id}")
+        try:
+            Ledger().record('instance', instance.id, parent_id=snapshot_id, name=name)
+        except Exception as e:
+            print(f"Warning: could not record instance in the ledger: {str(e)}")
         print(f"Status: {instance.status}")
         
         # Wait for instance to be ready
@@ -14,6 +14,7 @@ show_usage() {
   echo "  delete         - Delete a specific snapshot (requires SNAPSHOT_ID env var)"
   echo "  create-instance - Create a new instance from a snapshot (requires SNAPSHOT_ID env var)"
   echo "  ssh            - SSH into a Morph Cloud instance (requires INSTANCE_ID env var)"
+  echo "  reap           - Stop old instances in a loop; replicas share the work (see MORPH_COORDINATE)"
   echo "  all            - Run the comprehensive manager example"
   echo "  help           - Show this help message"
   echo ""
@@ -26,6 +27,8 @@ show_usage() {
   echo "  MEMORY        - Memory in MB for create operation (default: 4096)"
   echo "  DISK_SIZE     - Disk size in MB for create operation (default: 50000)"
   echo "  DIGEST        - Optional digest for create operation"
+  echo "  MORPH_COORDINATE - Set to 1 so scaled replicas shard work through /app/data/leases.db"
+  echo "  REAP_MAX_AGE_HOURS - Age after which reap stops instances (default: 24)"
   echo ""
   echo "Examples:"
   echo "  docker-compose run -e SNAPSHOT_ID=abc123 morph-cloud-app get"
@@ -113,6 +116,11 @@ case "$OPERATION" in
     echo "Connecting to instance $INSTANCE_ID via SSH..."
     python /app/ssh_to_instance.py "$INSTANCE_ID" | tee -a /app/data/app.log
     ;;
+  reap)
+    echo "Reaping instances older than ${REAP_MAX_AGE_HOURS:-24}h..."
+    # exec so docker stop's SIGTERM reaches Python, which leaves the lease group cleanly
+    exec python /app/morph_cloud.py reap --max-age-hours "${REAP_MAX_AGE_HOURS:-24}" > >(tee -a /app/data/app.log) 2>&1
+    ;;
   all)
     echo "Running comprehensive manager example..."
     python /app/morph_cloud_manager.py | tee -a /app/data/app.log
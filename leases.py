@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+
+# Coordination between several manager replicas sharing a data directory.
+#
+# Replicas register in a SQLite database (by default on the mounted /app/data
+# volume) and heartbeat every few seconds. Work is sharded by resource ID with
+# rendezvous hashing over the live replicas, and each resource is also claimed
+# with a short lease so two replicas never act on it during a membership
+# change. When a replica dies its heartbeat stops, it drops out of the live set
+# after one TTL and its shard is picked up by the others.
+
+import hashlib
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+DEFAULT_LEASE_DB = os.environ.get('MORPH_LEASE_DB', '/app/data/leases.db' if os.path.isdir('/app/data') else 'data/leases.db')
+DEFAULT_TTL = float(os.environ.get('MORPH_LEASE_TTL', 15))
+# How long a finished job without a run ID is remembered: long enough for replicas
+# started together to skip it, short enough that rerunning it later works
+DEFAULT_DONE_WINDOW = float(os.environ.get('MORPH_JOB_DONE_WINDOW', 600))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS replicas (replica_id TEXT PRIMARY KEY, heartbeat REAL NOT NULL, started REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, holder TEXT NOT NULL, expires REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS completed (key TEXT PRIMARY KEY, holder TEXT NOT NULL, finished REAL NOT NULL, expires REAL);
+"""
+
+
+class LeaseStore:
+    """
+    Leases, replica heartbeats and completion markers in a shared SQLite file.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or DEFAULT_LEASE_DB
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        with self._lock:
+            self._conn.executescript(_SCHEMA)
+            columns = [row[1] for row in self._conn.execute('PRAGMA table_info(completed)')]
+            if 'expires' not in columns:
+                # Databases created before completion markers could expire
+                self._conn.execute('ALTER TABLE completed ADD COLUMN expires REAL')
+
+    def _transaction(self, fn):
+        """Run fn(cursor) inside a write-locked transaction"""
+        with self._lock:
+            cursor = self._conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                result = fn(cursor)
+                cursor.execute('COMMIT')
+                return result
+            except Exception:
+                cursor.execute('ROLLBACK')
+                raise
+
+    def acquire(self, name, holder, ttl):
+        """
+        Take or renew a lease.
+
+        Returns:
+            True if holder now owns the lease
+        """
+        def _acquire(cursor):
+            now = time.time()
+            row = cursor.execute('SELECT holder, expires FROM leases WHERE name = ?', (name,)).fetchone()
+            if row and row[0] != holder and row[1] > now:
+                return False
+            cursor.execute('INSERT OR REPLACE INTO leases (name, holder, expires) VALUES (?, ?, ?)',
+                           (name, holder, now + ttl))
+            return True
+        return self._transaction(_acquire)
+
+    def release(self, name, holder):
+        self._transaction(lambda cursor: cursor.execute(
+            'DELETE FROM leases WHERE name = ? AND holder = ?', (name, holder)))
+
+    def release_all(self, holder):
+        self._transaction(lambda cursor: cursor.execute('DELETE FROM leases WHERE holder = ?', (holder,)))
+
+    def holder(self, name):
+        """Return the current holder of a lease, or None if it is free or expired"""
+        with self._lock:
+            row = self._conn.execute('SELECT holder, expires FROM leases WHERE name = ?', (name,)).fetchone()
+        if row and row[1] > time.time():
+            return row[0]
+        return None
+
+    def heartbeat(self, replica_id):
+        def _heartbeat(cursor):
+            now = time.time()
+            cursor.execute('INSERT INTO replicas (replica_id, heartbeat, started) VALUES (?, ?, ?) '
+                           'ON CONFLICT(replica_id) DO UPDATE SET heartbeat = excluded.heartbeat',
+                           (replica_id, now, now))
+        self._transaction(_heartbeat)
+
+    def remove_replica(self, replica_id):
+        self._transaction(lambda cursor: cursor.execute('DELETE FROM replicas WHERE replica_id = ?', (replica_id,)))
+
+    def live_replicas(self, ttl):
+        """Return the IDs of replicas that heartbeated within ttl seconds, sorted"""
+        with self._lock:
+            rows = self._conn.execute('SELECT replica_id FROM replicas WHERE heartbeat > ? ORDER BY replica_id',
+                                      (time.time() - ttl,)).fetchall()
+        return [row[0] for row in rows]
+
+    def mark_done(self, key, holder, keep=None):
+        """Record a finished job, remembered for keep seconds (forever when None)"""
+        now = time.time()
+        expires = now + keep if keep is not None else None
+        self._transaction(lambda cursor: cursor.execute(
+            'INSERT OR REPLACE INTO completed (key, holder, finished, expires) VALUES (?, ?, ?, ?)',
+            (key, holder, now, expires)))
+
+    def is_done(self, key):
+        with self._lock:
+            return self._conn.execute('SELECT 1 FROM completed WHERE key = ? AND (expires IS NULL OR expires > ?)',
+                                      (key, time.time())).fetchone() is not None
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _score(replica_id, resource_id):
+    return hashlib.sha1(f"{replica_id}:{resource_id}".encode()).digest()
+
+
+class Coordinator:
+    """
+    One replica's view of the group: shard ownership, resource claims and leadership.
+
+    Usage:
+        coordinator = Coordinator()
+        coordinator.start()
+        for instance in instances:
+            if coordinator.claim(instance.id):
+                ...  # only this replica acts on the instance
+        coordinator.stop()
+    """
+
+    def __init__(self, path=None, replica_id=None, ttl=DEFAULT_TTL):
+        self.store = LeaseStore(path)
+        # Container hostnames are unique per replica; the pid covers several processes per host
+        self.replica_id = replica_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.ttl = ttl
+        self._replicas = [self.replica_id]
+        self._jobs = set()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Register this replica and heartbeat in the background"""
+        self._beat()
+        self._thread = threading.Thread(target=self._heartbeat_loop, name='lease-heartbeat', daemon=True)
+        self._thread.start()
+        print(f"Coordinating as replica {self.replica_id} ({len(self._replicas)} live replicas)")
+        return self
+
+    def _beat(self):
+        self.store.heartbeat(self.replica_id)
+        self._replicas = self.store.live_replicas(self.ttl) or [self.replica_id]
+        # Keep running jobs' leases alive; if this replica dies they expire after one TTL
+        for name in list(self._jobs):
+            self.store.acquire(name, self.replica_id, self.ttl)
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(self.ttl / 3):
+            try:
+                self._beat()
+            except sqlite3.Error as e:
+                print(f"Warning: lease heartbeat failed: {e}")
+
+    @property
+    def replicas(self):
+        return list(self._replicas)
+
+    def owner(self, resource_id):
+        """The live replica responsible for a resource (rendezvous hashing)"""
+        return max(self._replicas, key=lambda replica_id: _score(replica_id, resource_id))
+
+    def owns(self, resource_id):
+        return self.owner(resource_id) == self.replica_id
+
+    def claim(self, resource_id, ttl=None):
+        """
+        Claim a resource if it is in this replica's shard and no other replica holds it.
+
+        Returns:
+            True if this replica should act on the resource
+        """
+        if not self.owns(resource_id):
+            return False
+        return self.store.acquire(f"resource:{resource_id}", self.replica_id, ttl or self.ttl)
+
+    def release(self, resource_id):
+        self.store.release(f"resource:{resource_id}", self.replica_id)
+
+    def run_once(self, key):
+        """
+        Claim a one-off job so only one replica runs it.
+
+        The job lease is renewed by the heartbeat while the job runs.
+
+        Returns:
+            True if this replica should run it; call finish(key) when it succeeds
+            or abandon(key) when it fails
+        """
+        if self.store.is_done(key):
+            return False
+        name = f"job:{key}"
+        if not self.store.acquire(name, self.replica_id, self.ttl):
+            return False
+        self._jobs.add(name)
+        return True
+
+    def finish(self, key, keep=None):
+        """
+        Mark a job done and release it.
+
+        Args:
+            key (str): The job key passed to run_once
+            keep (float, optional): Seconds other replicas keep skipping it; forever when None
+        """
+        self.store.mark_done(key, self.replica_id, keep)
+        self.abandon(key)
+
+    def abandon(self, key):
+        """Release a job without marking it done, so another replica or a rerun can retry it"""
+        name = f"job:{key}"
+        self._jobs.discard(name)
+        self.store.release(name, self.replica_id)
+
+    def holder(self, key):
+        return self.store.holder(f"job:{key}")
+
+    def stop(self):
+        """Leave the group, handing this replica's shard and leases over immediately"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self.store.release_all(self.replica_id)
+        self.store.remove_replica(self.replica_id)
+        self.store.close()
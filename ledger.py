@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+
+# Local ledger of every snapshot and instance this tool creates.
+# Each record keeps who created the resource, with which command, from which
+# parent resource and when, so resources that outlive their purpose (or were
+# never ours) can be found by comparing the ledger against the live account.
+
+import getpass
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+
+DEFAULT_LEDGER_DB = os.environ.get('MORPH_LEDGER_DB', 'data/ledger.db')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS resources (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    profile TEXT NOT NULL,
+    name TEXT,
+    parent_id TEXT,
+    creator TEXT NOT NULL,
+    command TEXT NOT NULL,
+    created REAL NOT NULL,
+    deleted REAL
+);
+CREATE INDEX IF NOT EXISTS resources_live ON resources (profile, kind, deleted);
+CREATE INDEX IF NOT EXISTS resources_parent ON resources (parent_id);
+"""
+
+
+def _creator():
+    try:
+        user = getpass.getuser()
+    except Exception:
+        user = 'unknown'
+    return f"{user}@{socket.gethostname()}"
+
+
+def _command():
+    return ' '.join([os.path.basename(sys.argv[0])] + sys.argv[1:]) if sys.argv and sys.argv[0] else 'python'
+
+
+class Ledger:
+    """
+    SQLite-backed record of created resources.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or DEFAULT_LEDGER_DB
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.executescript(_SCHEMA)
+        self.creator = _creator()
+        self.command = _command()
+
+    def record(self, kind, resource_id, profile='default', parent_id=None, name=None):
+        """
+        Record a newly created snapshot or instance.
+
+        Args:
+            kind (str): "snapshot" or "instance"
+            resource_id (str): ID of the new resource
+            profile (str): Profile/account the resource belongs to
+            parent_id (str, optional): Resource it was created from (snapshot or instance ID)
+            name (str, optional): Human-readable name given at creation
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO resources (id, kind, profile, name, parent_id, creator, command, created, deleted) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, NULL)',
+                (resource_id, kind, profile, name, parent_id, self.creator, self.command, time.time()))
+
+    def mark_deleted(self, resource_id):
+        with self._lock, self._conn:
+            self._conn.execute('UPDATE resources SET deleted = ? WHERE id = ? AND deleted IS NULL',
+                               (time.time(), resource_id))
+
+    def get(self, resource_id):
+        with self._lock:
+            row = self._conn.execute('SELECT * FROM resources WHERE id = ?', (resource_id,)).fetchone()
+        return dict(row) if row else None
+
+    def active(self, profile=None, kind=None):
+        """
+        Resources the ledger believes still exist.
+
+        Returns:
+            List of dicts with the ledger columns
+        """
+        query = 'SELECT * FROM resources WHERE deleted IS NULL'
+        params = []
+        if profile:
+            query += ' AND profile = ?'
+            params.append(profile)
+        if kind:
+            query += ' AND kind = ?'
+            params.append(kind)
+        with self._lock:
+            rows = self._conn.execute(query + ' ORDER BY created', params).fetchall()
+        return [dict(row) for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class OrphanReport:
+    """
+    Result of cross-checking the ledger against the live account.
+
+    Attributes:
+        tracked: ledger entries that are live and look healthy
+        leaked: live ledger instances older than the age limit or whose parent is gone,
+            and intermediate snapshots (taken from an instance) with no live children
+        unknown: live resources the ledger has never seen (live objects)
+        vanished: ledger entries no longer present in the account (now marked deleted)
+    """
+
+    def __init__(self):
+        self.tracked = []
+        self.leaked = []
+        self.unknown = []
+        self.vanished = []
+
+
+def find_orphans(ledger, instances, snapshots, profile='default', max_age_hours=24):
+    """
+    Compare the ledger with one listing of instances and snapshots.
+
+    Args:
+        ledger (Ledger): The ownership ledger
+        instances (list): Live instances from a single list call
+        snapshots (list): Live snapshots from a single list call
+        profile (str): Profile the listings came from
+        max_age_hours (float): Tracked instances older than this count as leaked. Snapshots
+            never leak by age, since base snapshots are meant to be reused.
+
+    Returns:
+        An OrphanReport; leaked/tracked/vanished entries are ledger dicts with a "reason" key
+    """
+    live = {instance.id: ('instance', instance) for instance in instances}
+    live.update({snapshot.id: ('snapshot', snapshot) for snapshot in snapshots})
+    entries = {entry['id']: entry for entry in ledger.active(profile=profile)}
+    cutoff = time.time() - max_age_hours * 3600
+    report = OrphanReport()
+
+    # Snapshots in use: live instances started from them, recorded or not
+    running = {instance.id: instance for instance in instances if getattr(instance, 'status', None) != 'stopped'}
+    in_use = {getattr(getattr(instance, 'refs', None), 'snapshot_id', None) for instance in running.values()}
+    in_use.update(entry['parent_id'] for resource_id, entry in entries.items()
+                  if entry['kind'] == 'instance' and resource_id in running)
+
+    for resource_id, entry in entries.items():
+        if resource_id not in live:
+            ledger.mark_deleted(resource_id)
+            entry['reason'] = 'no longer exists'
+            report.vanished.append(entry)
+            continue
+        parent_id = entry['parent_id']
+        if entry['kind'] == 'snapshot':
+            # Only snapshots taken as an intermediate step (e.g. by branch) are disposable
+            if parent_id and resource_id not in in_use:
+                entry['reason'] = f"intermediate snapshot of {parent_id} with no live children"
+                report.leaked.append(entry)
+            else:
+                report.tracked.append(entry)
+        elif parent_id and parent_id not in live and ledger.get(parent_id) is not None:
+            entry['reason'] = f"parent {parent_id} is gone"
+            report.leaked.append(entry)
+        elif entry['created'] < cutoff:
+            entry['reason'] = f"older than {max_age_hours:g}h"
+            report.leaked.append(entry)
+        else:
+            report.tracked.append(entry)
+
+    for resource_id, (kind, resource) in live.items():
+        if resource_id not in entries and ledger.get(resource_id) is None:
+            report.unknown.append((kind, resource))
+
+    return report
@@ -5,10 +5,26 @@
 #./morph_cloud.sh ssh --instance-id morphvm_oqv3oisg
 
 from morphcloud.api import MorphCloudClient
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import os
 import sys
 import time
 import argparse
+import asyncio
+import hashlib
+import signal
+import subprocess
+
+import readiness
+import tracing
+from cassette import Cassette
+from tunnels import Forward, TunnelManager, DEFAULT_BIND
+import batch
+from leases import Coordinator, DEFAULT_LEASE_DB, DEFAULT_TTL, DEFAULT_DONE_WINDOW
+import sharding
+import bench
+from ledger import Ledger, DEFAULT_LEDGER_DB, find_orphans
+from profiles import Profile, ProfileFanout, load_profiles
 
 class MorphCloudManager:
     """
@@ -16,17 +32,91 @@ class MorphCloudManager:
     This class provides methods for all operations available in the Morph Cloud API.
     """
     
-    def __init__(self, api_key=None):
-        """Initialize the Morph Cloud client with API key"""
+    def __init__(self, api_key=None, profiles=None, client=None):
+        """
+        Initialize the Morph Cloud client with API key or named profiles.
+        
+        Args:
+            api_key (str, optional): API key for a single account
+            profiles (dict, optional): Profile name to profiles.Profile; the first
+                profile backs single-account operations, all of them back fan-out
+            client (optional): Client to use instead of a MorphCloudClient, such as bench.FakeMorphClient
+        """
+        if profiles:
+            self.profiles = dict(profiles)
+            self._fanout = ProfileFanout(self.profiles)
+            self.profile = next(iter(self.profiles))
+            self.api_key = self.profiles[self.profile].api_key
+            self.client = self._fanout.clients[self.profile]
+            self.coordinator = None
+            self._ledger = None
+            return
+        
         # Get API key from parameter, environment variable, or config file
         self.api_key = api_key or os.environ.get('MORPH_API_KEY')
         
-        if not self.api_key:
+        if not self.api_key and client is None:
             raise ValueError("API key must be provided or set in MORPH_API_KEY environment variable")
             
         # Initialize the client with API key
-        self.client = MorphCloudClient(api_key=self.api_key)
+        self.client = tracing.instrument_client(client or MorphCloudClient(api_key=self.api_key))
+        self.profile = 'default'
+        self.profiles = {self.profile: Profile(self.profile, self.api_key)}
+        self._fanout = None
+        self.coordinator = None
+        self._ledger = None
     
+    @property
+    def fanout(self):
+        """ProfileFanout over every configured profile, sharing the existing clients"""
+        if self._fanout is None:
+            self._fanout = ProfileFanout(self.profiles, clients={self.profile: self.client})
+        return self._fanout
+    
+    def use_cassette(self, cassette):
+        """
+        Record or replay this manager's API traffic.
+        
+        Args:
+            cassette (cassette.Cassette): The record or replay session
+        """
+        cassette.install(self.client, label=self.profile)
+        for name, client in self.fanout.clients.items():
+            if client is not self.client:
+                cassette.install(client, label=name)
+    
+    @property
+    def ledger(self):
+        """Ownership ledger of the resources this tool creates (MORPH_LEDGER_DB)"""
+        if self._ledger is None:
+            self._ledger = Ledger(DEFAULT_LEDGER_DB)
+        return self._ledger
+    
+    def _record(self, kind, resource_id, parent_id=None, name=None):
+        """Record a created resource in the ledger; ledger trouble never fails the operation"""
+        try:
+            self.ledger.record(kind, resource_id, profile=self.profile, parent_id=parent_id, name=name)
+        except Exception as e:
+            print(f"Warning: could not record {kind} {resource_id} in the ledger: {str(e)}")
+    
+    def _forget(self, resource_id):
+        """Mark a resource as deleted in the ledger"""
+        try:
+            self.ledger.mark_deleted(resource_id)
+        except Exception as e:
+            print(f"Warning: could not update the ledger for {resource_id}: {str(e)}")
+    
+    def use_coordinator(self, coordinator):
+        """
+        Share work with other replicas: gc/reap only act on this replica's shard
+        and a batch plan runs on one replica only.
+        
+        Args:
+            coordinator (leases.Coordinator): A started coordinator
+        """
+        self.coordinator = coordinator
+    
+    @tracing.traced()
     def create_snapshot(self, vcpus=2, memory=4096, disk_size=50000, digest=None):
         """
         Create a new snapshot with specified resources.
@@ -48,12 +138,14 @@ class MorphCloudManager:
                 disk_size=disk_size,
                 digest=digest
             )
+            self._record('snapshot', new_snapshot.id, name=digest)
             print(f"Snapshot created with ID: {new_snapshot.id}")
             return new_snapshot
         except Exception as e:
             print(f"Error creating snapshot: {str(e)}")
             return None
     
+    @tracing.traced()
     def list_snapshots(self):
         """
         List all snapshots in your Morph Cloud account.
@@ -77,6 +169,7 @@ class MorphCloudManager:
             print(f"Error listing snapshots: {str(e)}")
             return []
     
+    @tracing.traced()
     def get_snapshot_details(self, snapshot_id):
         """
         Get detailed information about a specific snapshot.
@@ -105,6 +198,7 @@ class MorphCloudManager:
             print(f"Error getting snapshot details: {str(e)}")
             return None
     
+    @tracing.traced()
     def delete_snapshot(self, snapshot_id):
         """
         Delete a snapshot when it's no longer needed.
@@ -115,19 +209,111 @@ class MorphCloudManager:
         try:
             print(f"Deleting snapshot {snapshot_id}...")
             self.client.snapshots.delete(snapshot_id=snapshot_id)
+            self._forget(snapshot_id)
             print(f"Snapshot {snapshot_id} has been deleted")
             return True
         except Exception as e:
             print(f"Error deleting snapshot: {str(e)}")
             return False
             
-    def create_instance(self, snapshot_id, name=None):
+    @tracing.traced()
+    def wait_until_ready(self, instance, wait_for="running", timeout=30, commands=None):
+        """
+        Wait for an instance to reach a readiness level.
+        
+        Args:
+            instance: The instance object to wait for
+            wait_for (str): "running" for status only, "ssh" to also require a working SSH connection
+            timeout (float): Maximum time to wait in seconds
+            commands (list, optional): Extra commands that must succeed inside the instance
+            
+        Returns:
+            A readiness.ProbeResult; result.instance holds the refreshed instance
+        """
+        probes = readiness.probes_for(wait_for, self.client, commands)
+        return readiness.wait_for_instances([instance], probes, timeout=timeout)[0]
+    
+    @tracing.traced()
+    def wait_until_ready_many(self, instances, wait_for="running", timeout=120, commands=None, concurrency=200):
+        """
+        Wait for many instances concurrently from a single event loop.
+        
+        Args:
+            instances (list): Instance objects to wait for
+            wait_for (str): "running" or "ssh"
+            timeout (float): Per-instance deadline in seconds
+            commands (list, optional): Extra commands that must succeed inside each instance
+            concurrency (int): Maximum number of instances probed at once
+            
+        Returns:
+            List of readiness.ProbeResult objects in the same order as instances
+        """
+        probes = readiness.probes_for(wait_for, self.client, commands)
+        return readiness.wait_for_instances(instances, probes, timeout=timeout, concurrency=concurrency)
+    
+    @tracing.traced()
+    def probe_instances(self, instance_ids, probe_specs=None, wait_for="ssh", timeout=60, concurrency=200):
+        """
+        Probe many instances concurrently and report which ones are ready.
+        
+        Args:
+            instance_ids (list): IDs of the instances to probe
+            probe_specs (list, optional): Probe specifications (see readiness.parse_probe);
+                when omitted the probes for wait_for are used
+            wait_for (str): Readiness level used when no probe specifications are given
+            timeout (float): Per-instance deadline in seconds
+            concurrency (int): Maximum number of instances probed at once
+            
+        Returns:
+            List of readiness.ProbeResult objects
+        """
+        try:
+            if probe_specs:
+                probes = [readiness.parse_probe(spec, self.client) for spec in probe_specs]
+            else:
+                probes = readiness.probes_for(wait_for, self.client)
+            
+            # One list call instead of one get per instance
+            known = {instance.id: instance for instance in self.client.instances.list()}
+            missing = [instance_id for instance_id in instance_ids if instance_id not in known]
+            for instance_id in missing:
+                print(f"Instance {instance_id} not found, skipping")
+            instances = [known[instance_id] for instance_id in instance_ids if instance_id in known]
+            
+            print(f"Probing {len(instances)} instances ({', '.join(probe.name for probe in probes)})...")
+            results = readiness.wait_for_instances(instances, probes, timeout=timeout, concurrency=concurrency)
+            for result in results:
+                if result.ok:
+                    print(f"{result.instance_id}: ready in {result.elapsed:.2f}s ({result.attempts} attempts)")
+                else:
+                    print(f"{result.instance_id}: NOT READY after {result.elapsed:.2f}s - {result.error}")
+            ready = sum(1 for result in results if result.ok)
+            print(f"{ready}/{len(results)} instances ready")
+            return results
+        except Exception as e:
+            print(f"Error probing instances: {str(e)}")
+            return []
+    
+    def _report_readiness(self, result, wait_for):
+        """Print the outcome of a readiness wait"""
+        if result.ok:
+            label = "running" if wait_for == "running" else "running and accepting SSH"
+            print(f"Instance is now {label} ({result.elapsed:.1f}s).")
+        else:
+            print(f"Instance {result.instance_id} not ready after {result.elapsed:.1f}s: {result.error}")
+    
+    @tracing.traced()
+    def create_instance(self, snapshot_id, name=None, wait_for="running", timeout=30, require_ready=False):
         """
         Create a new instance from a snapshot.
         
         Args:
             snapshot_id (str): ID of the snapshot to use
             name (str, optional): Name for the new instance
+            wait_for (str): Readiness level to wait for, "running" or "ssh"
+            timeout (float): Maximum time to wait for readiness in seconds
+            require_ready (bool): Treat a failed readiness wait as an error: the
+                instance is stopped and None is returned
         
         Returns:
             The created instance object
@@ -137,6 +323,7 @@ class MorphCloudManager:
             
             # Use the correct method: start() instead of create()
             instance = self.client.instances.start(snapshot_id=snapshot_id)
+            self._record('instance', instance.id, parent_id=snapshot_id, name=name)
             
             # Set name if provided (may need to be done separately depending on API)
             if name and hasattr(instance, 'name'):
@@ -147,16 +334,16 @@ class MorphCloudManager:
             print(f"Status: {instance.status}")
             
             # Wait for instance to be ready
-            if instance.status != "running":
-                print("Waiting for instance to start...")
-                for _ in range(30):  # Wait up to 30 seconds
-                    time.sleep(1)
-                    instance = self.client.instances.get(instance_id=instance.id)
-                    if instance.status == "running":
-                        print("Instance is now running.")
-                        break
-                else:
-                    print("Note: Instance creation initiated but not yet running.")
+            if instance.status != "running" or wait_for != "running":
+                print(f"Waiting for instance to be {wait_for}-ready...")
+                result = self.wait_until_ready(instance, wait_for=wait_for, timeout=timeout)
+                instance = result.instance
+                self._report_readiness(result, wait_for)
+                if not result.ok:
+                    if require_ready:
+                        self._stop_instances([instance])
+                        return None
+                    print("Note: Instance creation initiated but not yet ready.")
                     print("Check status later or start it manually if needed.")
             
             print(f"\nTo SSH into this instance, use:")
@@ -167,6 +354,119 @@ class MorphCloudManager:
             print(f"Error creating instance: {str(e)}")
             return None
             
+    @tracing.traced()
+    def start_instances(self, snapshot_id, count, concurrency=32):
+        """
+        Start several instances from one snapshot concurrently, without waiting for readiness.
+        
+        Args:
+            snapshot_id (str): ID of the snapshot to use
+            count (int): Number of instances to start
+            concurrency (int): Maximum start calls in flight
+            
+        Returns:
+            List of the instances that started (failures are printed and skipped)
+        """
+        instances = []
+        start = tracing.bind_context(self.client.instances.start)
+        with ThreadPoolExecutor(max_workers=max(1, min(count, concurrency))) as executor:
+            futures = [executor.submit(start, snapshot_id=snapshot_id) for _ in range(count)]
+            for future in as_completed(futures):
+                try:
+                    instance = future.result()
+                    self._record('instance', instance.id, parent_id=snapshot_id)
+                    instances.append(instance)
+                except Exception as e:
+                    print(f"Error starting instance from {snapshot_id}: {str(e)}")
+        return instances
+    
+    def _stop_instances(self, instances, concurrency=32):
+        """Stop instances in parallel and mark them deleted in the ledger; failures are printed"""
+        def _stop(instance):
+            with tracing.span("instance.stop", instance_id=instance.id):
+                instance.stop()
+            self._forget(instance.id)
+        
+        with ThreadPoolExecutor(max_workers=max(1, min(len(instances), concurrency))) as executor:
+            futures = {executor.submit(tracing.bind_context(_stop), instance): instance for instance in instances}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                    print(f"  stopped {futures[future].id}")
+                except Exception as e:
+                    print(f"  Error stopping {futures[future].id}: {str(e)}")
+    
+    @tracing.traced()
+    def branch(self, instance_id, count, wait_for="ssh", timeout=300, concurrency=32, keep_failed=False):
+        """
+        Clone a running instance into several new instances.
+        
+        The instance is snapshotted once and every copy starts from that snapshot in
+        parallel, so expensive in-memory warm-up is paid once instead of per copy.
+        
+        Args:
+            instance_id (str): ID of the running instance to clone
+            count (int): Number of copies to start
+            wait_for (str): Readiness level to wait for, "running" or "ssh"
+            timeout (float): Seconds to wait for each copy to be ready
+            concurrency (int): Maximum start calls in flight
+            keep_failed (bool): Leave copies that never became ready running for debugging
+            
+        Returns:
+            Dict with snapshot_id, instance_ids (ready copies), failed_ids and the
+            snapshot_seconds / start_seconds / ready_seconds phase timings, or None on error
+        """
+        try:
+            print(f"Branching instance {instance_id} into {count} copies...")
+            instance = self.client.instances.get(instance_id=instance_id)
+            if instance.status != "running":
+                print(f"Instance {instance_id} is not running (status: {instance.status})")
+                return None
+            
+            started = time.monotonic()
+            with tracing.span("instance.snapshot", instance_id=instance_id):
+                snapshot = instance.snapshot()
+            self._record('snapshot', snapshot.id, parent_id=instance_id)
+            snapshot_seconds = time.monotonic() - started
+            print(f"Snapshot {snapshot.id} taken in {snapshot_seconds:.1f}s")
+            
+            started = time.monotonic()
+            instances = self.start_instances(snapshot.id, count, concurrency=concurrency)
+            start_seconds = time.monotonic() - started
+            print(f"Started {len(instances)}/{count} copies in {start_seconds:.1f}s, waiting for {wait_for}-readiness...")
+            
+            started = time.monotonic()
+            results = self.wait_until_ready_many(instances, wait_for=wait_for, timeout=timeout)
+            ready_seconds = time.monotonic() - started
+            
+            ready_ids = [result.instance_id for result in results if result.ok]
+            failed_ids = [result.instance_id for result in results if not result.ok]
+            for result in results:
+                if not result.ok:
+                    print(f"  {result.instance_id}: not ready - {result.error}")
+            if failed_ids and not keep_failed:
+                print(f"Stopping {len(failed_ids)} copies that never became ready...")
+                self._stop_instances([result.instance for result in results if not result.ok], concurrency)
+            for ready_id in ready_ids:
+                print(f"  {ready_id}")
+            
+            print(f"\n{len(ready_ids)}/{count} copies ready")
+            print(f"Snapshot phase: {snapshot_seconds:.1f}s")
+            print(f"Fan-out phase:  {start_seconds + ready_seconds:.1f}s "
+                  f"(start {start_seconds:.1f}s, readiness {ready_seconds:.1f}s)")
+            return {
+                'snapshot_id': snapshot.id,
+                'instance_ids': ready_ids,
+                'failed_ids': failed_ids,
+                'snapshot_seconds': snapshot_seconds,
+                'start_seconds': start_seconds,
+                'ready_seconds': ready_seconds,
+            }
+        except Exception as e:
+            print(f"Error branching instance: {str(e)}")
+            return None
+    
+    @tracing.traced()
     def list_instances(self):
         """
         List all instances in your Morph Cloud account.
@@ -194,6 +494,7 @@ class MorphCloudManager:
             print(f"Error listing instances: {str(e)}")
             return []
             
+    @tracing.traced()
     def get_instance_details(self, instance_id):
         """
         Get detailed information about a specific instance.
@@ -225,6 +526,7 @@ class MorphCloudManager:
             print(f"Error getting instance details: {str(e)}")
             return None
             
+    @tracing.traced()
     def delete_instance(self, instance_id):
         """
         Delete an instance when it's no longer needed.
@@ -235,19 +537,26 @@ class MorphCloudManager:
         try:
             print(f"Stopping instance {instance_id}...")
             instance = self.client.instances.get(instance_id=instance_id)
-            instance.stop()
+            with tracing.span("instance.stop", instance_id=instance_id):
+                instance.stop()
+            self._forget(instance_id)
             print(f"Instance {instance_id} has been stopped")
             return True
         except Exception as e:
             print(f"Error stopping instance: {str(e)}")
             return False
             
-    def start_instance(self, instance_id):
+    @tracing.traced()
+    def start_instance(self, instance_id, wait_for="running", timeout=30, require_ready=False):
         """
         Start a stopped instance.
         
         Args:
             instance_id (str): ID of the instance to start
+            wait_for (str): Readiness level to wait for, "running" or "ssh"
+            timeout (float): Maximum time to wait for readiness in seconds
+            require_ready (bool): Treat a failed readiness wait as an error and return
+                None; a newly started instance is stopped again
         """
         try:
             print(f"Starting instance {instance_id}...")
@@ -257,6 +566,12 @@ class MorphCloudManager:
             
             if instance.status == "running":
                 print("Instance is already running.")
+                if wait_for != "running":
+                    result = self.wait_until_ready(instance, wait_for=wait_for, timeout=timeout)
+                    self._report_readiness(result, wait_for)
+                    instance = result.instance
+                    if require_ready and not result.ok:
+                        return None
                 return instance
             
             # Get the snapshot ID associated with this instance
@@ -271,21 +586,22 @@ class MorphCloudManager:
             # Start a new instance using the same snapshot ID
             print(f"Starting instance using snapshot ID: {snapshot_id}")
             new_instance = self.client.instances.start(snapshot_id=snapshot_id)
+            self._record('instance', new_instance.id, parent_id=snapshot_id)
             
             print(f"Instance started with ID: {new_instance.id}")
             print(f"Status: {new_instance.status}")
             
             # Wait for instance to be ready
-            if new_instance.status != "running":
-                print("Waiting for instance to start...")
-                for _ in range(30):  # Wait up to 30 seconds
-                    time.sleep(1)
-                    new_instance = self.client.instances.get(instance_id=new_instance.id)
-                    if new_instance.status == "running":
-                        print("Instance is now running.")
-                        break
-                else:
-                    print("Note: Instance start initiated but not yet running.")
+            if new_instance.status != "running" or wait_for != "running":
+                print(f"Waiting for instance to be {wait_for}-ready...")
+                result = self.wait_until_ready(new_instance, wait_for=wait_for, timeout=timeout)
+                new_instance = result.instance
+                self._report_readiness(result, wait_for)
+                if not result.ok:
+                    if require_ready:
+                        self._stop_instances([new_instance])
+                        return None
+                    print("Note: Instance start initiated but not yet ready.")
                     print("Check status later.")
             
             return new_instance
@@ -293,6 +609,7 @@ class MorphCloudManager:
             print(f"Error starting instance: {str(e)}")
             return None
             
+    @tracing.traced()
     def stop_instance(self, instance_id):
         """
         Stop a running instance.
@@ -308,13 +625,16 @@ class MorphCloudManager:
                 print(f"Instance is not running (status: {instance.status}).")
                 return instance
                 
-            instance.stop()
+            with tracing.span("instance.stop", instance_id=instance_id):
+                instance.stop()
+            self._forget(instance_id)
             print("Waiting for instance to stop...")
             
             # Wait for instance to stop
-            for _ in range(30):  # Wait up to 30 seconds
-                time.sleep(1)
-                instance = self.client.instances.get(instance_id=instance_id)
+            for attempt in range(30):  # Wait up to 30 seconds
+                with tracing.span("poll", attempt=attempt + 1):
+                    readiness.clock.sleep(1)
+                    instance = self.client.instances.get(instance_id=instance_id)
                 if instance.status != "running":
                     print(f"Instance is now {instance.status}.")
                     break
@@ -327,12 +647,15 @@ class MorphCloudManager:
             print(f"Error stopping instance: {str(e)}")
             return None
             
-    def ssh_to_instance(self, instance_id):
+    @tracing.traced()
+    def ssh_to_instance(self, instance_id, wait_for="ssh", timeout=60):
         """
         SSH into a specific Morph Cloud instance.
         
         Args:
             instance_id (str): ID of the instance to SSH into
+            wait_for (str): Readiness level required before connecting, "running" or "ssh"
+            timeout (float): Maximum time to wait for readiness in seconds
         """
         try:
             print(f"Retrieving instance {instance_id}...")
@@ -357,28 +680,28 @@ class MorphCloudManager:
                     # Start a new instance using the same snapshot ID
                     print(f"Starting instance using snapshot ID: {snapshot_id}")
                     new_instance = self.client.instances.start(snapshot_id=snapshot_id)
+                    self._record('instance', new_instance.id, parent_id=snapshot_id)
                     instance_id = new_instance.id
                     
                     print(f"New instance started with ID: {instance_id}")
-                    print("Waiting for instance to start...")
-                    
-                    # Wait for instance to start
-                    for _ in range(30):  # Wait up to 30 seconds
-                        time.sleep(1)
-                        instance = self.client.instances.get(instance_id=instance_id)
-                        if instance.status == "running":
-                            print("Instance is now running.")
-                            break
-                    else:
-                        print("Timed out waiting for instance to start.")
-                        return
+                    instance = new_instance
                 else:
                     print("SSH connection aborted.")
                     return
             
+            # Make sure sshd is accepting connections, not just that the VM is up
+            print(f"Waiting for instance to be {wait_for}-ready...")
+            result = self.wait_until_ready(instance, wait_for=wait_for, timeout=timeout)
+            instance = result.instance
+            self._report_readiness(result, wait_for)
+            if not result.ok:
+                print("Timed out waiting for instance to become ready.")
+                return
+            
             # Connect via SSH
             print(f"Connecting to instance {instance_id} via SSH...")
-            instance.ssh()
+            with tracing.span("instance.ssh", instance_id=instance_id):
+                instance.ssh()
             
         except Exception as e:
             print(f"Error: {str(e)}")
@@ -388,6 +711,430 @@ class MorphCloudManager:
             print("3. Check that your API key has the necessary permissions")
             print("4. Ensure the instance is accessible from your network")
 
+    @tracing.traced()
+    def exec_command(self, instance_id, command):
+        """
+        Run a command inside an instance.
+        
+        Args:
+            instance_id (str): ID of the instance
+            command (str): Shell command to run
+            
+        Returns:
+            The exec result (exit_code, stdout, stderr), or None on error
+        """
+        try:
+            print(f"Running on {instance_id}: {command}")
+            instance = self.client.instances.get(instance_id=instance_id)
+            with tracing.span("instance.exec", instance_id=instance_id):
+                result = instance.exec(command)
+            if getattr(result, 'stdout', None):
+                print(result.stdout.rstrip())
+            if getattr(result, 'stderr', None):
+                print(result.stderr.rstrip())
+            print(f"Exit code: {result.exit_code}")
+            return result
+        except Exception as e:
+            print(f"Error running command: {str(e)}")
+            return None
+    
+    @tracing.traced()
+    def run_batch(self, plan_path, concurrency=None, dry_run=False, run_id=None):
+        """
+        Run a plan file of operations as a dependency DAG.
+        
+        Args:
+            plan_path (str): Path to the YAML/JSON plan (see batch.py for the format)
+            concurrency (int, optional): Override the plan's concurrency cap
+            dry_run (bool): Only print the execution levels
+            run_id (str, optional): With coordination, replicas given the same plan and run ID
+                run it once; without one a finished plan is only skipped for a short window
+            
+        Returns:
+            True if every step succeeded
+        """
+        try:
+            steps, plan_concurrency = batch.load_plan(plan_path)
+        except (OSError, batch.PlanError) as e:
+            print(f"Error loading plan: {str(e)}")
+            return False
+        
+        print(f"Loaded {len(steps)} steps from {plan_path}")
+        if dry_run:
+            batch.print_plan(steps)
+            return True
+        
+        job_key = None
+        if self.coordinator:
+            # Every replica sees the same plan; the first one to claim it runs it
+            with open(plan_path, 'rb') as f:
+                job_key = f"batch:{hashlib.sha1(f.read()).hexdigest()}"
+            if run_id:
+                job_key += f":{run_id}"
+            if not self.coordinator.run_once(job_key):
+                holder = self.coordinator.holder(job_key)
+                state = f"is being run by {holder}" if holder else "has already been run"
+                print(f"Plan {plan_path} {state}; skipping")
+                return True
+        
+        runner = batch.BatchRunner(self, steps, concurrency or plan_concurrency)
+        ok = runner.run()
+        runner.print_summary()
+        if job_key:
+            if ok:
+                self.coordinator.finish(job_key, keep=None if run_id else DEFAULT_DONE_WINDOW)
+            else:
+                # Let another replica (or a rerun) retry the plan
+                self.coordinator.abandon(job_key)
+        return ok
+    
+    @tracing.traced()
+    def shard_run(self, snapshot_id, shards, command, tests_file=None, list_command=None,
+                  report_format=None, output=None, history_file=None, ready_timeout=300, keep=False):
+        """
+        Run a test suite split across N ephemeral instances.
+        
+        Args:
+            snapshot_id (str): Snapshot the shard instances start from
+            shards (int): Number of instances / shards
+            command (str or list): Test command as a shell snippet or argv list (see
+                sharding.build_command); {tests} and {report} are substituted,
+                otherwise the shard's tests are appended
+            tests_file (str, optional): File with one test ID per line ("-" for stdin)
+            list_command (str, optional): Local command printing one test ID per line
+            report_format (str, optional): "junit" or "json" report written to {report}
+            output (str, optional): Where to write the merged report
+            history_file (str, optional): Local test-duration history used for balancing
+            ready_timeout (float): Seconds to wait for each instance to be SSH-ready
+            keep (bool): Leave the instances running afterwards
+            
+        Returns:
+            True if every shard exited with status 0
+        """
+        try:
+            if tests_file == '-':
+                tests = sys.stdin.read().split()
+            elif tests_file:
+                with open(tests_file) as f:
+                    tests = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+            elif list_command:
+                listing = subprocess.run(list_command, shell=True, check=True, capture_output=True, text=True)
+                tests = [line.strip() for line in listing.stdout.splitlines() if line.strip()]
+            else:
+                print("Error: provide --tests-file or --list-command")
+                return False
+            if not tests:
+                print("Error: no tests to run")
+                return False
+            
+            print(f"Running {len(tests)} tests on {shards} shards from snapshot {snapshot_id}...")
+            started = time.monotonic()
+            runner = sharding.ShardRunner(self, snapshot_id, shards, command, tests, report_format=report_format,
+                                          history=sharding.DurationHistory(history_file),
+                                          ready_timeout=ready_timeout, keep=keep)
+            results = runner.run()
+            wall = time.monotonic() - started
+            
+            print(f"\n{'SHARD':<6} {'INSTANCE':<22} {'TESTS':>6} {'PREDICTED':>10} {'ACTUAL':>8} {'EXIT':>5}")
+            for shard in results:
+                exit_code = shard.exit_code if shard.exit_code is not None else '-'
+                print(f"{shard.index:<6} {shard.instance_id or '-':<22} {len(shard.tests):>6} "
+                      f"{shard.predicted:>9.1f}s {shard.elapsed:>7.1f}s {exit_code:>5}")
+            serial = sum(shard.elapsed for shard in results)
+            print(f"Wall clock {wall:.1f}s for {serial:.1f}s of shard time")
+            
+            if report_format:
+                output = output or f"data/shard-report.{'xml' if report_format == 'junit' else 'json'}"
+                if sharding.merge_reports(results, report_format, output):
+                    print(f"Merged report written to {output}")
+            
+            return bool(results) and all(shard.exit_code == 0 for shard in results)
+        except Exception as e:
+            print(f"Error running shards: {str(e)}")
+            return False
+    
+    @tracing.traced()
+    def find_orphans(self, max_age_hours=24, cleanup=None, dry_run=True, concurrency=16):
+        """
+        Cross-check the ownership ledger against the account and optionally clean up.
+        
+        Uses a single instance listing and a single snapshot listing. Ledger entries
+        that no longer exist are marked deleted.
+        
+        Args:
+            max_age_hours (float): Ledger resources older than this are reported as leaked
+            cleanup (str, optional): "leaked", "unknown" or "all" to delete those resources
+            dry_run (bool): Only report what cleanup would delete
+            concurrency (int): Maximum delete calls in flight
+            
+        Returns:
+            A ledger.OrphanReport, or None on error
+        """
+        try:
+            print("Checking the ownership ledger against the account...")
+            instances = self.client.instances.list()
+            snapshots = self.client.snapshots.list()
+            report = find_orphans(self.ledger, instances, snapshots, profile=self.profile,
+                                  max_age_hours=max_age_hours)
+            
+            print(f"{len(report.tracked)} tracked, {len(report.leaked)} leaked, "
+                  f"{len(report.unknown)} unknown, {len(report.vanished)} vanished")
+            if report.leaked:
+                print("\nLeaked (created by this tool):")
+                for entry in report.leaked:
+                    created = time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['created']))
+                    print(f"  {entry['kind']:<8} {entry['id']}  {entry['reason']}; created {created} "
+                          f"by {entry['creator']} via '{entry['command']}'")
+            if report.unknown:
+                print("\nUnknown (not in the ledger):")
+                for kind, resource in report.unknown:
+                    print(f"  {kind:<8} {resource.id}  {getattr(resource, 'status', '')}")
+            if report.vanished:
+                print(f"\n{len(report.vanished)} ledger entries no longer exist and were marked deleted")
+            
+            if not cleanup:
+                return report
+            
+            targets = []
+            if cleanup in ('leaked', 'all'):
+                targets += [(entry['kind'], entry['id']) for entry in report.leaked]
+            if cleanup in ('unknown', 'all'):
+                targets += [(kind, resource.id) for kind, resource in report.unknown]
+            if dry_run:
+                for kind, resource_id in targets:
+                    print(f"Would delete {kind} {resource_id}")
+                print(f"{len(targets)} resources would be deleted (pass --yes to delete them)")
+                return report
+            
+            def _delete(kind, resource_id):
+                if kind == 'instance':
+                    with tracing.span("instance.stop", instance_id=resource_id):
+                        self.client.instances.get(instance_id=resource_id).stop()
+                else:
+                    self.client.snapshots.delete(snapshot_id=resource_id)
+                self._forget(resource_id)
+            
+            # Instances go first so no snapshot is deleted from under a running instance
+            deleted = 0
+            for kind in ('instance', 'snapshot'):
+                ids = [resource_id for target_kind, resource_id in targets if target_kind == kind]
+                if not ids:
+                    continue
+                with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(ids)))) as executor:
+                    futures = {executor.submit(tracing.bind_context(_delete), kind, resource_id): resource_id
+                               for resource_id in ids}
+                    for future in as_completed(futures):
+                        try:
+                            future.result()
+                            deleted += 1
+                            print(f"Deleted {kind} {futures[future]}")
+                        except Exception as e:
+                            print(f"Error deleting {kind} {futures[future]}: {str(e)}")
+            print(f"Deleted {deleted}/{len(targets)} resources")
+            return report
+        except Exception as e:
+            print(f"Error checking for orphans: {str(e)}")
+            return None
+    
+    @tracing.traced()
+    def bench_shapes(self, vcpus, memory, disk_size, runs=3, workload=None, timeout=300,
+                     interval=0.1, concurrency=16, output=None):
+        """
+        Benchmark boot latency across a grid of snapshot shapes.
+        
+        Creates one snapshot per vCPU/memory/disk combination, boots runs instances
+        from each and times them to running, to SSH readiness and through the optional
+        workload. Every instance and snapshot is removed afterwards.
+        
+        Args:
+            vcpus (str): Comma-separated vCPU counts
+            memory (str): Comma-separated memory sizes in MB
+            disk_size (str): Comma-separated disk sizes in MB
+            runs (int): Instances booted per shape
+            workload (str, optional): Command timed inside each SSH-ready instance
+            timeout (float): Seconds each instance may take to become SSH-ready
+            interval (float): Seconds between readiness polls
+            concurrency (int): Maximum instances booting at once
+            output (str, optional): Path of a JSON file for the raw samples and summary
+            
+        Returns:
+            The bench.ShapeBench with its samples, or None on error
+        """
+        try:
+            shapes = bench.parse_grid(vcpus, memory, disk_size)
+            if not shapes or runs < 1:
+                print("Error: the grid is empty or --runs is below 1")
+                return None
+            runner = bench.ShapeBench(self, shapes, runs=runs, workload=workload, timeout=timeout,
+                                      interval=interval, concurrency=concurrency,
+                                      ssh_endpoint=getattr(self.client, 'ssh_endpoint', None))
+            runner.run()
+            runner.print_table()
+            if output:
+                runner.write_json(output)
+                print(f"Samples written to {output}")
+            return runner
+        except Exception as e:
+            print(f"Error benchmarking shapes: {str(e)}")
+            return None
+    
+    def reap(self, interval=60, max_age_hours=24, statuses=None):
+        """
+        Run gc every interval seconds until interrupted.
+        
+        With a coordinator, each replica only collects its own shard, so adding
+        replicas spreads the work instead of repeating it.
+        
+        Args:
+            interval (float): Seconds between passes
+            max_age_hours (float): Passed to gc_instances
+            statuses (list, optional): Passed to gc_instances
+        """
+        print(f"Reaping instances older than {max_age_hours}h every {interval}s (Ctrl-C to stop)...")
+        try:
+            while True:
+                started = time.monotonic()
+                self.gc_instances(max_age_hours=max_age_hours, statuses=statuses, dry_run=False)
+                time.sleep(max(interval - (time.monotonic() - started), 0))
+        except KeyboardInterrupt:
+            print("\nReaper stopped.")
+    
+    def tunnel(self, forward_specs, bind=DEFAULT_BIND, report_interval=30):
+        """
+        Forward local ports to instances until interrupted.
+        
+        All forwards run in one event loop with one SSH transport per instance;
+        transports are re-established automatically after an instance restarts.
+        
+        Args:
+            forward_specs (list): INSTANCE:LOCAL_PORT:[REMOTE_HOST:]REMOTE_PORT strings
+            bind (str): Local address to listen on
+            report_interval (float): Seconds between throughput/latency reports (0 to disable)
+        """
+        try:
+            forwards = [Forward.parse(spec, bind=bind) for spec in forward_specs]
+            manager = TunnelManager(self.client, forwards, report_interval=report_interval)
+            print(f"Starting {len(forwards)} tunnels to {len(manager.transports)} instances (Ctrl-C to stop)...")
+            asyncio.run(manager.run())
+        except KeyboardInterrupt:
+            print("\nTunnels closed.")
+        except Exception as e:
+            print(f"Error running tunnels: {str(e)}")
+    
+    @tracing.traced()
+    def list_instances_all_profiles(self):
+        """
+        List instances across every configured profile concurrently.
+        
+        Results are printed as each account answers, tagged with the profile name.
+        
+        Returns:
+            List of (profile, instance) tuples
+        """
+        print(f"Listing instances across {len(self.profiles)} profiles...")
+        instances = []
+        for result in self.fanout.run(lambda client: client.instances.list()):
+            if not result.ok:
+                print(f"[{result.profile}] Error listing instances: {result.error}")
+                continue
+            for instance in result.value:
+                instances.append((result.profile, instance))
+                print(f"[{result.profile}] ID: {instance.id}, Status: {instance.status}")
+        print(f"Found {len(instances)} instances")
+        return instances
+    
+    @tracing.traced()
+    def list_snapshots_all_profiles(self):
+        """
+        List snapshots across every configured profile concurrently.
+        
+        Returns:
+            List of (profile, snapshot) tuples
+        """
+        print(f"Listing snapshots across {len(self.profiles)} profiles...")
+        snapshots = []
+        for result in self.fanout.run(lambda client: client.snapshots.list()):
+            if not result.ok:
+                print(f"[{result.profile}] Error listing snapshots: {result.error}")
+                continue
+            for snapshot in result.value:
+                snapshots.append((result.profile, snapshot))
+                print(f"[{result.profile}] ID: {snapshot.id}, Created At: {snapshot.created}")
+        print(f"Found {len(snapshots)} snapshots")
+        return snapshots
+    
+    @tracing.traced()
+    def find_instance(self, instance_id):
+        """
+        Look up an instance in every configured profile concurrently.
+        
+        Args:
+            instance_id (str): ID of the instance to find
+            
+        Returns:
+            A (profile, instance) tuple, or (None, None) if no account owns it
+        """
+        print(f"Looking up instance {instance_id} across {len(self.profiles)} profiles...")
+        for result in self.fanout.run(lambda client: client.instances.get(instance_id=instance_id)):
+            if result.ok:
+                instance = result.value
+                print(f"[{result.profile}] ID: {instance.id}, Status: {instance.status}")
+                return result.profile, instance
+        print(f"Instance {instance_id} not found in any profile")
+        return None, None
+    
+    @tracing.traced()
+    def gc_instances(self, max_age_hours=24, statuses=None, dry_run=True):
+        """
+        Stop old instances across every configured profile.
+        
+        Args:
+            max_age_hours (float): Only instances created longer ago than this are collected
+            statuses (list, optional): Only collect instances in these states
+            dry_run (bool): Only report what would be stopped
+            
+        Returns:
+            Dict of profile name to list of collected instance IDs
+        """
+        cutoff = time.time() - max_age_hours * 3600
+        candidates = {}
+        for profile, instance in self.list_instances_all_profiles():
+            created = getattr(instance, 'created', None)
+            if created is None or created > cutoff:
+                continue
+            if statuses and instance.status not in statuses:
+                continue
+            candidates.setdefault(profile, []).append(instance.id)
+        
+        if self.coordinator and not dry_run:
+            # Only act on instances in this replica's shard that no other replica holds
+            claimed = {profile: [instance_id for instance_id in ids if self.coordinator.claim(instance_id)]
+                       for profile, ids in candidates.items()}
+            skipped = sum(len(ids) for ids in candidates.values()) - sum(len(ids) for ids in claimed.values())
+            print(f"{skipped} eligible instances belong to other replicas' shards")
+            candidates = {profile: ids for profile, ids in claimed.items() if ids}
+        
+        total = sum(len(ids) for ids in candidates.values())
+        print(f"{total} instances older than {max_age_hours}h eligible for collection")
+        if dry_run or not total:
+            for profile, ids in candidates.items():
+                for instance_id in ids:
+                    print(f"[{profile}] would stop {instance_id}")
+            return candidates
+        
+        collected = {}
+        def stop(client, instance_id):
+            with tracing.span("instance.stop", instance_id=instance_id):
+                client.instances.get(instance_id=instance_id).stop()
+        for result in self.fanout.run(stop, items=candidates):
+            if result.ok:
+                collected.setdefault(result.profile, []).append(result.item)
+                self._forget(result.item)
+                print(f"[{result.profile}] stopped {result.item}")
+            else:
+                print(f"[{result.profile}] Error stopping {result.item}: {result.error}")
+        return collected
+
 
 def main():
     parser = argparse.ArgumentParser(description='Morph Cloud Manager')
@@ -401,7 +1148,8 @@ def main():
     create_snapshot_parser.add_argument('--digest', help='Optional digest identifier')
     
     # List snapshots command
-    subparsers.add_parser('list-snapshots', help='List all snapshots')
+    list_snapshots_parser = subparsers.add_parser('list-snapshots', help='List all snapshots')
+    list_snapshots_parser.add_argument('--all-profiles', action='store_true', help='List across every configured profile')
     
     # Get snapshot details command
     get_snapshot_parser = subparsers.add_parser('get-snapshot', help='Get details of a specific snapshot')
@@ -415,13 +1163,17 @@ def main():
     create_instance_parser = subparsers.add_parser('create-instance', help='Create a new instance from a snapshot')
     create_instance_parser.add_argument('--snapshot-id', required=True, help='ID of the snapshot to use')
     create_instance_parser.add_argument('--name', help='Name for the new instance')
+    create_instance_parser.add_argument('--wait-for', choices=readiness.READY_LEVELS, default='running', help='Readiness level to wait for')
+    create_instance_parser.add_argument('--ready-timeout', type=float, default=30, help='Seconds to wait for readiness')
     
     # List instances command
-    subparsers.add_parser('list-instances', help='List all instances')
+    list_instances_parser = subparsers.add_parser('list-instances', help='List all instances')
+    list_instances_parser.add_argument('--all-profiles', action='store_true', help='List across every configured profile')
     
     # Get instance details command
     get_instance_parser = subparsers.add_parser('get-instance', help='Get details of a specific instance')
     get_instance_parser.add_argument('--instance-id', required=True, help='ID of the instance')
+    get_instance_parser.add_argument('--all-profiles', action='store_true', help='Search every configured profile')
     
     # Delete instance command
     delete_instance_parser = subparsers.add_parser('delete-instance', help='Delete an instance')
@@ -430,6 +1182,8 @@ def main():
     # Start instance command
     start_instance_parser = subparsers.add_parser('start-instance', help='Start a stopped instance')
     start_instance_parser.add_argument('--instance-id', required=True, help='ID of the instance to start')
+    start_instance_parser.add_argument('--wait-for', choices=readiness.READY_LEVELS, default='running', help='Readiness level to wait for')
+    start_instance_parser.add_argument('--ready-timeout', type=float, default=30, help='Seconds to wait for readiness')
     
     # Stop instance command
     stop_instance_parser = subparsers.add_parser('stop-instance', help='Stop a running instance')
@@ -438,9 +1192,110 @@ def main():
     # SSH to instance command
     ssh_parser = subparsers.add_parser('ssh', help='SSH into a Morph Cloud instance')
     ssh_parser.add_argument('--instance-id', required=True, help='ID of the instance to SSH into')
+    ssh_parser.add_argument('--wait-for', choices=readiness.READY_LEVELS, default='ssh', help='Readiness level required before connecting')
+    ssh_parser.add_argument('--ready-timeout', type=float, default=60, help='Seconds to wait for readiness')
+    
+    # Probe instances command
+    probe_parser = subparsers.add_parser('probe', help='Check readiness of many instances concurrently')
+    probe_parser.add_argument('--instance-id', action='append', required=True, help='ID of an instance to probe (repeatable)')
+    probe_parser.add_argument('--probe', action='append', help='Probe to run: status, tcp[:host[:port]], banner[:host[:port]] or cmd:<command> (repeatable)')
+    probe_parser.add_argument('--wait-for', choices=readiness.READY_LEVELS, default='ssh', help='Readiness level to check when no --probe is given')
+    probe_parser.add_argument('--timeout', type=float, default=60, help='Seconds to wait for each instance')
+    probe_parser.add_argument('--concurrency', type=int, default=200, help='Maximum instances probed at once')
+    
+    # Branch command
+    branch_parser = subparsers.add_parser('branch', help='Clone a running instance into N new instances')
+    branch_parser.add_argument('--instance-id', required=True, help='ID of the running instance to clone')
+    branch_parser.add_argument('--count', type=int, required=True, help='Number of copies to start')
+    branch_parser.add_argument('--wait-for', choices=readiness.READY_LEVELS, default='ssh', help='Readiness level to wait for')
+    branch_parser.add_argument('--ready-timeout', type=float, default=300, help='Seconds to wait for each copy')
+    branch_parser.add_argument('--concurrency', type=int, default=32, help='Maximum start calls in flight')
+    branch_parser.add_argument('--keep-failed', action='store_true', help='Leave copies that never became ready running')
+    
+    # Exec command
+    exec_parser = subparsers.add_parser('exec', help='Run a command inside an instance')
+    exec_parser.add_argument('--instance-id', required=True, help='ID of the instance')
+    exec_parser.add_argument('--command', required=True, dest='exec_command', help='Command to run')
+    
+    # Batch command
+    batch_parser = subparsers.add_parser('batch', help='Run a plan file of operations as a dependency DAG')
+    batch_parser.add_argument('plan', help='YAML or JSON plan file')
+    batch_parser.add_argument('--concurrency', type=int, help="Override the plan's concurrency cap")
+    batch_parser.add_argument('--dry-run', action='store_true', help='Only show the execution order')
+    batch_parser.add_argument('--run-id', default=os.environ.get('MORPH_RUN_ID'),
+                              help='With --coordinate, replicas sharing this ID run the plan once (or set MORPH_RUN_ID)')
+    
+    # Orphans command
+    orphans_parser = subparsers.add_parser('orphans', help='Find leaked or unknown resources using the ownership ledger')
+    orphans_parser.add_argument('--max-age-hours', type=float, default=24, help='Ledger resources older than this count as leaked')
+    orphans_parser.add_argument('--cleanup', choices=['leaked', 'unknown', 'all'], help='Delete these resources')
+    orphans_parser.add_argument('--yes', action='store_true', help='Actually delete instead of a dry run')
+    
+    # Bench-shapes command
+    bench_parser = subparsers.add_parser('bench-shapes', help='Compare boot latency across snapshot shapes')
+    bench_parser.add_argument('--vcpus', default='1,2,4', help='Comma-separated vCPU counts')
+    bench_parser.add_argument('--memory', default='2048,4096', help='Comma-separated memory sizes in MB')
+    bench_parser.add_argument('--disk-size', default='20000', help='Comma-separated disk sizes in MB')
+    bench_parser.add_argument('--runs', type=int, default=3, help='Instances booted per shape')
+    bench_parser.add_argument('--workload', help='Command to time inside each SSH-ready instance')
+    bench_parser.add_argument('--ready-timeout', type=float, default=300, help='Seconds each instance may take to become SSH-ready')
+    bench_parser.add_argument('--poll-interval', type=float, default=0.1, help='Seconds between readiness polls')
+    bench_parser.add_argument('--concurrency', type=int, default=16, help='Maximum instances booting at once')
+    bench_parser.add_argument('--output', help='Write raw samples and the summary to this JSON file')
+    bench_parser.add_argument('--fake', action='store_true', help='Run against a local simulated backend')
+    bench_parser.add_argument('--fake-speed', type=float, default=5, help='Speed-up factor of the simulated backend')
+    
+    # Tunnel command
+    tunnel_parser = subparsers.add_parser('tunnel', help='Forward many local ports to instances over shared SSH transports')
+    tunnel_parser.add_argument('--forward', action='append', required=True, metavar='INSTANCE:LOCAL:[HOST:]REMOTE', help='Port forward (repeatable)')
+    tunnel_parser.add_argument('--bind', default=DEFAULT_BIND, help='Local address to listen on')
+    tunnel_parser.add_argument('--report-interval', type=float, default=30, help='Seconds between tunnel reports (0 to disable)')
+    
+    # Garbage-collect instances command
+    gc_parser = subparsers.add_parser('gc', help='Stop old instances across every configured profile')
+    gc_parser.add_argument('--max-age-hours', type=float, default=24, help='Collect instances older than this')
+    gc_parser.add_argument('--status', action='append', help='Only collect instances in this state (repeatable)')
+    gc_parser.add_argument('--yes', action='store_true', help='Actually stop the instances instead of a dry run')
+    
+    # Trace report command
+    trace_report_parser = subparsers.add_parser('trace-report', help='Show the slowest traced operations from a span file')
+    trace_report_parser.add_argument('--file', required=True, help='Span file written with --trace-file')
+    trace_report_parser.add_argument('--limit', type=int, default=5, help='Number of traces to show')
+    trace_report_parser.add_argument('--min-ms', type=float, default=0.0, help='Hide child spans shorter than this')
+    
+    # Shard-run command
+    shard_parser = subparsers.add_parser('shard-run', help='Split a test suite across N ephemeral instances')
+    shard_parser.add_argument('--snapshot-id', required=True, help='Snapshot the shard instances start from')
+    shard_parser.add_argument('--shards', type=int, required=True, help='Number of instances to fan out over')
+    shard_parser.add_argument('--tests-file', help='File with one test ID per line ("-" for stdin)')
+    shard_parser.add_argument('--list-command', help='Local command that prints one test ID per line')
+    shard_parser.add_argument('--report-format', choices=['junit', 'json'], help='Report format the test command writes to {report}')
+    shard_parser.add_argument('--output', help='Path of the merged report')
+    shard_parser.add_argument('--history-file', help='Test-duration history used for balancing')
+    shard_parser.add_argument('--ready-timeout', type=float, default=300, help='Seconds to wait for each instance')
+    shard_parser.add_argument('--keep', action='store_true', help='Leave the instances running afterwards')
+    shard_parser.add_argument('test_command', nargs=argparse.REMAINDER, help='-- followed by the test command')
+    
+    # Reap command
+    reap_parser = subparsers.add_parser('reap', help='Run gc in a loop (use --coordinate with several replicas)')
+    reap_parser.add_argument('--interval', type=float, default=60, help='Seconds between passes')
+    reap_parser.add_argument('--max-age-hours', type=float, default=24, help='Collect instances older than this')
+    reap_parser.add_argument('--status', action='append', help='Only collect instances in this state (repeatable)')
     
     # Global arguments
     parser.add_argument('--api-key', help='Morph Cloud API key (can also be set via MORPH_API_KEY environment variable)')
+    parser.add_argument('--profile', action='append', help='Named profile to use (repeatable; see --profiles-file)')
+    parser.add_argument('--profiles-file', help='JSON file of named profiles (default: MORPH_PROFILES_FILE or ~/.morph/profiles.json)')
+    parser.add_argument('--trace-file', help='Append tracing spans to this JSON-lines file (or set MORPH_TRACE_FILE)')
+    parser.add_argument('--coordinate', action='store_true', default=bool(os.environ.get('MORPH_COORDINATE')),
+                        help='Share work with other replicas through a lease database (or set MORPH_COORDINATE=1)')
+    parser.add_argument('--lease-db', default=DEFAULT_LEASE_DB, help='SQLite lease database shared by the replicas')
+    parser.add_argument('--lease-ttl', type=float, default=DEFAULT_TTL, help='Seconds before a silent replica is considered dead')
+    parser.add_argument('--replica-id', help='Name of this replica (default: hostname-pid)')
+    parser.add_argument('--record', metavar='CASSETTE', help='Record all API traffic to this cassette file')
+    parser.add_argument('--replay', metavar='CASSETTE', help='Serve API traffic from this cassette file instead of the live service')
+    parser.add_argument('--replay-speed', type=float, default=1.0, help='Replay speed factor for responses and poll intervals (2 = twice as fast, 0 = no delays)')
+    parser.add_argument('--trace-otlp', help='POST tracing spans to this collector URL (or set MORPH_TRACE_OTLP_ENDPOINT)')
     
     args = parser.parse_args()
     
@@ -448,39 +1303,128 @@ def main():
         parser.print_help()
         return
     
+    if args.command == 'trace-report':
+        tracing.print_report(args.file, limit=args.limit, min_ms=args.min_ms)
+        return
+    
+    tracing.configure(trace_file=args.trace_file, otlp_endpoint=args.trace_otlp)
+    
+    cassette = None
+    coordinator = None
     try:
+        # Load named profiles when asked for, or when the command spans accounts
+        profiles = None
+        if args.profile or args.profiles_file or getattr(args, 'all_profiles', False) or args.command == 'gc':
+            profiles = load_profiles(args.profiles_file, args.profile)
+        
+        # Replayed sessions never reach the API, so any key will do
+        api_key = args.api_key
+        if args.replay and not profiles:
+            api_key = api_key or os.environ.get('MORPH_API_KEY') or 'replay'
+        
         # Initialize the manager
-        manager = MorphCloudManager(api_key=args.api_key)
+        if getattr(args, 'fake', False):
+            # Simulated backend: nothing leaves the process, so keep its resources out of the real ledger
+            manager = MorphCloudManager(client=bench.FakeMorphClient(speed=args.fake_speed))
+            manager._ledger = Ledger(':memory:')
+        else:
+            manager = MorphCloudManager(api_key=api_key, profiles=profiles)
+        
+        if args.record:
+            cassette = Cassette.record(args.record)
+        elif args.replay:
+            cassette = Cassette.replay(args.replay, speed=args.replay_speed)
+            # Poll loops run on the same compressed time as the replayed responses
+            readiness.use_clock(readiness.ScaledClock(args.replay_speed))
+        if cassette:
+            manager.use_cassette(cassette)
+        
+        if args.coordinate:
+            coordinator = Coordinator(args.lease_db, replica_id=args.replica_id, ttl=args.lease_ttl).start()
+            manager.use_coordinator(coordinator)
+            # Leave the group cleanly on docker stop so the shard is handed over at once
+            signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
         
         # Execute the requested command
         if args.command == 'create-snapshot':
             manager.create_snapshot(vcpus=args.vcpus, memory=args.memory, disk_size=args.disk_size, digest=args.digest)
         elif args.command == 'list-snapshots':
-            manager.list_snapshots()
+            if args.all_profiles:
+                manager.list_snapshots_all_profiles()
+            else:
+                manager.list_snapshots()
         elif args.command == 'get-snapshot':
             manager.get_snapshot_details(args.snapshot_id)
         elif args.command == 'delete-snapshot':
             manager.delete_snapshot(args.snapshot_id)
         elif args.command == 'create-instance':
-            manager.create_instance(args.snapshot_id, args.name)
+            manager.create_instance(args.snapshot_id, args.name, wait_for=args.wait_for, timeout=args.ready_timeout)
         elif args.command == 'list-instances':
-            manager.list_instances()
+            if args.all_profiles:
+                manager.list_instances_all_profiles()
+            else:
+                manager.list_instances()
         elif args.command == 'get-instance':
-            manager.get_instance_details(args.instance_id)
+            if args.all_profiles:
+                manager.find_instance(args.instance_id)
+            else:
+                manager.get_instance_details(args.instance_id)
         elif args.command == 'delete-instance':
             manager.delete_instance(args.instance_id)
         elif args.command == 'start-instance':
-            manager.start_instance(args.instance_id)
+            manager.start_instance(args.instance_id, wait_for=args.wait_for, timeout=args.ready_timeout)
         elif args.command == 'stop-instance':
             manager.stop_instance(args.instance_id)
         elif args.command == 'ssh':
-            manager.ssh_to_instance(args.instance_id)
+            manager.ssh_to_instance(args.instance_id, wait_for=args.wait_for, timeout=args.ready_timeout)
+        elif args.command == 'probe':
+            manager.probe_instances(args.instance_id, probe_specs=args.probe, wait_for=args.wait_for,
+                                    timeout=args.timeout, concurrency=args.concurrency)
+        elif args.command == 'branch':
+            manager.branch(args.instance_id, args.count, wait_for=args.wait_for,
+                           timeout=args.ready_timeout, concurrency=args.concurrency, keep_failed=args.keep_failed)
+        elif args.command == 'exec':
+            manager.exec_command(args.instance_id, args.exec_command)
+        elif args.command == 'batch':
+            if not manager.run_batch(args.plan, concurrency=args.concurrency, dry_run=args.dry_run, run_id=args.run_id):
+                sys.exit(1)
+        elif args.command == 'shard-run':
+            test_command = args.test_command[1:] if args.test_command[:1] == ['--'] else args.test_command
+            if not test_command:
+                print("Error: give the test command after --")
+                sys.exit(2)
+            ok = manager.shard_run(args.snapshot_id, args.shards, sharding.command_template(test_command),
+                                   tests_file=args.tests_file, list_command=args.list_command,
+                                   report_format=args.report_format, output=args.output,
+                                   history_file=args.history_file, ready_timeout=args.ready_timeout, keep=args.keep)
+            if not ok:
+                sys.exit(1)
+        elif args.command == 'reap':
+            manager.reap(interval=args.interval, max_age_hours=args.max_age_hours, statuses=args.status)
+        elif args.command == 'orphans':
+            manager.find_orphans(max_age_hours=args.max_age_hours, cleanup=args.cleanup, dry_run=not args.yes)
+        elif args.command == 'bench-shapes':
+            ok = manager.bench_shapes(args.vcpus, args.memory, args.disk_size, runs=args.runs,
+                                      workload=args.workload, timeout=args.ready_timeout,
+                                      interval=args.poll_interval, concurrency=args.concurrency,
+                                      output=args.output)
+            if not ok:
+                sys.exit(1)
+        elif args.command == 'tunnel':
+            manager.tunnel(args.forward, bind=args.bind, report_interval=args.report_interval)
+        elif args.command == 'gc':
+            manager.gc_instances(max_age_hours=args.max_age_hours, statuses=args.status, dry_run=not args.yes)
     
     except ValueError as e:
         print(f"Error: {str(e)}")
         print("Hint: Set your API key using the --api-key option or the MORPH_API_KEY environment variable")
     except Exception as e:
         print(f"Error: {str(e)}")
+    finally:
+        if coordinator:
+            coordinator.stop()
+        if cassette:
+            cassette.close()
 
 
 if __name__ == "__main__":
@@ -35,6 +35,17 @@ show_usage() {
     echo "  stop-instance     Stop a running instance"
     echo "  delete-instance   Delete an instance"
     echo "  ssh               SSH into a Morph Cloud instance"
+    echo "  probe             Check readiness of many instances concurrently"
+    echo "  branch            Clone a running instance into N new instances"
+    echo "  exec              Run a command inside an instance"
+    echo "  batch             Run a plan file of operations as a dependency DAG"
+    echo "  shard-run         Split a test suite across N ephemeral instances"
+    echo "  bench-shapes      Compare boot latency across snapshot shapes"
+    echo "  reap              Run gc in a loop (use --coordinate with several replicas)"
+    echo "  tunnel            Forward local ports to instances over shared SSH transports"
+    echo "  gc                Stop old instances across every configured profile"
+    echo "  orphans           Find leaked or unknown resources using the ownership ledger"
+    echo "  trace-report      Show the slowest traced operations from a span file"
     echo "  help              Show this help message"
     echo ""
     echo "For command-specific options, run:"
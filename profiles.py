@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+
+# Named Morph Cloud credentials and concurrent fan-out across them.
+# Each profile gets its own client, concurrency cap, rate limit and timeout,
+# so one slow or failing account cannot stall operations on the others.
+
+from morphcloud.api import MorphCloudClient
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+import json
+import os
+import queue
+import threading
+import time
+
+import tracing
+
+DEFAULT_PROFILES_FILE = os.path.expanduser(os.environ.get('MORPH_PROFILES_FILE', '~/.morph/profiles.json'))
+
+
+class Profile:
+    """
+    A named set of Morph Cloud credentials and per-account limits.
+    """
+
+    def __init__(self, name, api_key, base_url=None, max_concurrency=4, rate_limit=10.0, timeout=60.0):
+        self.name = name
+        self.api_key = api_key
+        self.base_url = base_url
+        self.max_concurrency = max_concurrency
+        self.rate_limit = rate_limit
+        self.timeout = timeout
+
+    def make_client(self):
+        """Create a MorphCloudClient bound to this profile"""
+        if self.base_url:
+            return MorphCloudClient(api_key=self.api_key, base_url=self.base_url)
+        return MorphCloudClient(api_key=self.api_key)
+
+    def __repr__(self):
+        return f"<Profile {self.name}>"
+
+
+def load_profiles(path=None, names=None):
+    """
+    Load named profiles.
+
+    Profiles come from a JSON file mapping names to settings, for example
+    {"team-a": {"api_key": "...", "max_concurrency": 4, "rate_limit": 10}},
+    or from MORPH_PROFILES as "team-a=key1,team-b=key2". API keys may also be
+    given indirectly with "api_key_env" naming an environment variable.
+
+    Args:
+        path (str, optional): Path to the profiles file
+        names (list, optional): Only return these profiles
+
+    Returns:
+        Dict of profile name to Profile, in definition order
+    """
+    profiles = {}
+
+    env_profiles = os.environ.get('MORPH_PROFILES')
+    if env_profiles:
+        for entry in env_profiles.split(','):
+            name, _, api_key = entry.strip().partition('=')
+            if name and api_key:
+                profiles[name] = Profile(name, api_key)
+
+    path = path or DEFAULT_PROFILES_FILE
+    if os.path.exists(path):
+        with open(path) as f:
+            data = json.load(f)
+        for name, settings in data.items():
+            settings = dict(settings)
+            api_key = settings.pop('api_key', None)
+            api_key_env = settings.pop('api_key_env', None)
+            if not api_key and api_key_env:
+                api_key = os.environ.get(api_key_env)
+            if not api_key:
+                raise ValueError(f"Profile {name} has no API key")
+            profiles[name] = Profile(name, api_key, **settings)
+
+    if names:
+        unknown = [name for name in names if name not in profiles]
+        if unknown:
+            raise ValueError(f"Unknown profile(s): {', '.join(unknown)}")
+        profiles = {name: profiles[name] for name in names}
+
+    return profiles
+
+
+class RateLimiter:
+    """
+    Thread-safe limiter spacing calls at least 1/rate seconds apart.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+class FanoutResult:
+    """
+    One result from a fan-out call, tagged with the profile it came from.
+    """
+
+    def __init__(self, profile, value=None, error=None, elapsed=0.0, item=None):
+        self.profile = profile
+        self.value = value
+        self.error = error
+        self.elapsed = elapsed
+        self.item = item
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class DaemonPool:
+    """
+    Fixed-size thread pool whose workers are daemon threads.
+    
+    ThreadPoolExecutor workers are joined at interpreter exit, so a call to an
+    account that never answers would keep the process alive after its profile
+    timed out. Here such a worker is simply abandoned, and replace() starts
+    another one in its place so the queue behind it keeps moving.
+    """
+
+    def __init__(self, workers, name='fanout'):
+        self._workers = max(1, workers)
+        self._name = name
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._spawned = 0
+        self._abandoned = set()
+        self._started = {}
+        for _ in range(self._workers):
+            self._spawn()
+
+    def _spawn(self):
+        with self._lock:
+            index = self._spawned
+            self._spawned += 1
+        threading.Thread(target=self._work, name=f"{self._name}-{index}", daemon=True).start()
+
+    def submit(self, fn, *args):
+        future = Future()
+        self._queue.put((future, fn, args))
+        return future
+
+    def started(self, future):
+        """time.monotonic() at which a worker picked the call up, or None while it is queued"""
+        return self._started.get(future)
+
+    def replace(self, future):
+        """Start a worker in place of the one stuck on future; the stuck one exits if the call ever returns"""
+        with self._lock:
+            self._abandoned.add(future)
+        self._spawn()
+
+    def _work(self):
+        while True:
+            task = self._queue.get()
+            if task is None:
+                return
+            future, fn, args = task
+            if not future.set_running_or_notify_cancel():
+                continue
+            self._started[future] = time.monotonic()
+            try:
+                future.set_result(fn(*args))
+            except BaseException as e:
+                future.set_exception(e)
+            with self._lock:
+                if future in self._abandoned:
+                    return
+
+    def shutdown(self):
+        """Let idle workers exit once the queue drains; busy ones finish (or hang) on their own"""
+        for _ in range(self._workers):
+            self._queue.put(None)
+
+
+class ProfileFanout:
+    """
+    Run operations across several profiles concurrently, one client per profile.
+    """
+
+    def __init__(self, profiles, clients=None):
+        self.profiles = dict(profiles)
+        clients = clients or {}
+        self.clients = {name: tracing.instrument_client(clients.get(name) or profile.make_client())
+                        for name, profile in self.profiles.items()}
+        self._limiters = {name: RateLimiter(profile.rate_limit) for name, profile in self.profiles.items()}
+
+    def _call(self, name, fn, item):
+        with tracing.span("fanout.call", profile=name):
+            self._limiters[name].acquire()
+            start = time.monotonic()
+            if item is None:
+                value = fn(self.clients[name])
+            else:
+                value = fn(self.clients[name], item)
+            return value, time.monotonic() - start
+
+    def run(self, fn, items=None):
+        """
+        Call fn for every profile and yield results as they complete.
+
+        Args:
+            fn (callable): Called as fn(client) or, when items is given, fn(client, item)
+            items (dict, optional): Profile name to list of items; fn is called once per item
+
+        Yields:
+            FanoutResult objects, fastest profiles first. A call that exceeds its
+            profile's timeout or raises yields a result with error set instead of
+            stalling the rest. The timeout runs from when the call starts, so items
+            queued behind a profile's max_concurrency are never expired unstarted.
+        """
+        tasks = []
+        if items is None:
+            tasks = [(name, None) for name in self.profiles]
+        else:
+            for name, profile_items in items.items():
+                tasks.extend((name, item) for item in profile_items)
+        if not tasks:
+            return
+
+        # A pool per profile, so a slow account only ever ties up its own workers
+        executors = {name: DaemonPool(profile.max_concurrency, name=f"fanout-{name}")
+                     for name, profile in self.profiles.items()}
+        start = time.monotonic()
+        futures = {}
+
+        def _deadline(future, now):
+            # A queued call cannot have started before now, so that bounds its deadline
+            name = futures[future][0]
+            return (executors[name].started(future) or now) + self.profiles[name].timeout
+
+        try:
+            futures = {executors[name].submit(tracing.bind_context(self._call), name, fn, item): (name, item) for name, item in tasks}
+            pending = set(futures)
+            while pending:
+                now = time.monotonic()
+                # Expire only the calls that ran out of time; the rest keep going
+                for future in [future for future in pending if now >= _deadline(future, now)]:
+                    pending.discard(future)
+                    name, item = futures[future]
+                    executors[name].replace(future)
+                    yield FanoutResult(name, error=TimeoutError(f"profile {name} timed out"),
+                                       elapsed=now - executors[name].started(future), item=item)
+                if not pending:
+                    break
+
+                next_deadline = min(_deadline(future, now) for future in pending)
+                done, _ = wait(pending, timeout=max(next_deadline - now, 0), return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.discard(future)
+                    name, item = futures[future]
+                    try:
+                        value, elapsed = future.result()
+                        yield FanoutResult(name, value=value, elapsed=elapsed, item=item)
+                    except Exception as e:
+                        yield FanoutResult(name, error=e, elapsed=time.monotonic() - start, item=item)
+        finally:
+            for future in futures:
+                future.cancel()
+            for executor in executors.values():
+                executor.shutdown()
@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+
+# Readiness probes for Morph Cloud instances.
+# An instance reporting status "running" does not mean sshd is accepting
+# connections yet, so these probes let callers wait for real SSH readiness.
+
+import asyncio
+import contextvars
+import os
+import shlex
+import threading
+import time
+
+import tracing
+
+# Morph Cloud exposes instance SSH through a shared gateway
+DEFAULT_SSH_HOST = os.environ.get('MORPH_SSH_HOST', 'ssh.cloud.morph.so')
+DEFAULT_SSH_PORT = int(os.environ.get('MORPH_SSH_PORT', 22))
+
+# Readiness levels accepted by MorphCloudManager and the CLI
+READY_LEVELS = ('running', 'ssh')
+
+# Poll speed-up used for --replay-speed 0, where requests are answered without delay
+MAX_REPLAY_SPEED = 1000.0
+
+
+class Clock:
+    """
+    Time source for poll loops. Readiness waits and the manager's own polling
+    read the time and sleep through readiness.clock so replay can compress them.
+    """
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def real(self, seconds):
+        """Real seconds corresponding to seconds on this clock"""
+        return seconds
+
+    def sleep(self, seconds):
+        time.sleep(self.real(seconds))
+
+    async def async_sleep(self, seconds):
+        await asyncio.sleep(self.real(seconds))
+
+
+class ScaledClock(Clock):
+    """
+    Clock running speed times faster than real time (0 means MAX_REPLAY_SPEED).
+    Replayed responses are served speed times faster too, so deadlines and poll
+    counts match the recorded session.
+    """
+
+    def __init__(self, speed):
+        self.speed = speed or MAX_REPLAY_SPEED
+        self._origin = time.monotonic()
+
+    def monotonic(self):
+        return self._origin + (time.monotonic() - self._origin) * self.speed
+
+    def real(self, seconds):
+        return seconds / self.speed
+
+
+clock = Clock()
+
+
+def use_clock(new_clock):
+    """Replace the clock used by poll loops (see ScaledClock)"""
+    global clock
+    clock = new_clock
+
+
+async def to_daemon_thread(fn, *args, **kwargs):
+    """
+    Run a blocking call in its own daemon thread and await the result.
+    
+    Unlike asyncio.to_thread, the call never queues behind a shared worker pool, and a
+    call abandoned after a timeout keeps neither the event loop nor the interpreter
+    from finishing.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    context = contextvars.copy_context()
+
+    def _settle(setter, value):
+        if not future.done():
+            setter(value)
+
+    def _run():
+        try:
+            result = context.run(fn, *args, **kwargs)
+        except BaseException as e:
+            outcome = (future.set_exception, e)
+        else:
+            outcome = (future.set_result, result)
+        try:
+            loop.call_soon_threadsafe(_settle, *outcome)
+        except RuntimeError:
+            pass  # The loop finished without waiting for this call
+
+    threading.Thread(target=_run, name='readiness-probe', daemon=True).start()
+    return await future
+
+
+class ProbeTarget:
+    """
+    The instance being probed.
+    Probes that refresh the instance (such as StatusProbe) update it in place
+    so later probes see the latest state.
+    """
+
+    def __init__(self, instance):
+        self.instance = instance
+        self.instance_id = instance.id
+
+
+class ProbeResult:
+    """
+    Outcome of waiting for one instance to pass all of its probes.
+    """
+
+    def __init__(self, instance_id, ok, elapsed, attempts, instance=None, error=None):
+        self.instance_id = instance_id
+        self.ok = ok
+        self.elapsed = elapsed
+        self.attempts = attempts
+        self.instance = instance
+        self.error = error
+
+    def __repr__(self):
+        state = "ready" if self.ok else f"not ready ({self.error})"
+        return f"<ProbeResult {self.instance_id} {state} after {self.elapsed:.2f}s>"
+
+
+class StatusProbe:
+    """
+    Refresh the instance from the API and check that its status is "running".
+    """
+
+    name = 'status'
+
+    def __init__(self, client, timeout=10.0):
+        self.client = client
+        self.timeout = timeout
+
+    async def check(self, target):
+        instance = await to_daemon_thread(self.client.instances.get, instance_id=target.instance_id)
+        target.instance = instance
+        if instance.status != "running":
+            raise RuntimeError(f"status is {instance.status}")
+
+
+class TcpConnectProbe:
+    """
+    Check that a TCP connection to the instance's SSH endpoint can be opened.
+    """
+
+    name = 'tcp'
+
+    def __init__(self, host=None, port=None, timeout=5.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+    def address(self, target):
+        """
+        Resolve the host and port to probe for a target.
+
+        Args:
+            target (ProbeTarget): The instance being probed
+
+        Returns:
+            A (host, port) tuple
+        """
+        host = self.host
+        if not host:
+            networking = getattr(target.instance, 'networking', None)
+            host = getattr(networking, 'external_ip', None) or DEFAULT_SSH_HOST
+        return host, self.port or DEFAULT_SSH_PORT
+
+    async def check(self, target):
+        host, port = self.address(target)
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            await self.on_connect(reader, writer)
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+    async def on_connect(self, reader, writer):
+        pass
+
+
+class SshBannerProbe(TcpConnectProbe):
+    """
+    Check that the SSH endpoint answers with an SSH protocol banner.
+    """
+
+    name = 'banner'
+
+    async def on_connect(self, reader, writer):
+        banner = await reader.readline()
+        if not banner.startswith(b'SSH-'):
+            raise RuntimeError(f"unexpected SSH banner: {banner[:40]!r}")
+
+
+class CommandProbe:
+    """
+    Run a command inside the instance and check that it exits with status 0.
+    """
+
+    name = 'command'
+
+    def __init__(self, command='true', timeout=15.0):
+        self.command = command
+        self.timeout = timeout
+
+    async def check(self, target):
+        result = await to_daemon_thread(target.instance.exec, self.command)
+        exit_code = getattr(result, 'exit_code', 0)
+        if exit_code != 0:
+            raise RuntimeError(f"command {self.command!r} exited with {exit_code}")
+
+
+def probes_for(level, client, commands=None):
+    """
+    Build the probe list for a readiness level.
+
+    Args:
+        level (str): "running" or "ssh"
+        client: The MorphCloudClient used to refresh instance status
+        commands (list, optional): Extra commands that must succeed in the instance
+
+    Returns:
+        List of probe objects
+    """
+    if level not in READY_LEVELS:
+        raise ValueError(f"Unknown readiness level: {level} (expected one of {', '.join(READY_LEVELS)})")
+
+    probes = [StatusProbe(client)]
+    if level == 'ssh':
+        probes.append(SshBannerProbe())
+        probes.append(CommandProbe('true'))
+    for command in commands or []:
+        probes.append(CommandProbe(command))
+    return probes
+
+
+def parse_probe(spec, client):
+    """
+    Build a probe from a command-line specification.
+
+    Accepted forms: "status", "tcp[:host[:port]]", "banner[:host[:port]]",
+    "cmd:<command>".
+
+    Args:
+        spec (str): The probe specification
+        client: The MorphCloudClient used by status probes
+
+    Returns:
+        A probe object
+    """
+    kind, _, rest = spec.partition(':')
+    if kind == 'status':
+        return StatusProbe(client)
+    if kind in ('tcp', 'banner'):
+        host, _, port = rest.partition(':')
+        probe_class = TcpConnectProbe if kind == 'tcp' else SshBannerProbe
+        return probe_class(host=host or None, port=int(port) if port else None)
+    if kind == 'cmd' and rest:
+        # Validate quoting early so a typo fails before any instance is probed
+        shlex.split(rest)
+        return CommandProbe(rest)
+    raise ValueError(f"Invalid probe specification: {spec}")
+
+
+async def wait_ready(instance, probes, timeout=60.0, interval=1.0, on_attempt=None):
+    """
+    Poll an instance until every probe passes or the timeout expires.
+
+    Probes run in order on each attempt and each one is bounded by its own
+    timeout, so a hung connection cannot stall the whole wait.
+
+    Args:
+        instance: The instance object to probe
+        probes (list): Probe objects to run
+        timeout (float): Overall deadline in seconds
+        interval (float): Delay between attempts in seconds
+        on_attempt (callable, optional): Called with (instance_id, attempt, error) after each attempt
+
+    Returns:
+        A ProbeResult
+    """
+    target = ProbeTarget(instance)
+    start = clock.monotonic()
+    deadline = start + timeout
+    attempts = 0
+    error = None
+
+    while True:
+        attempts += 1
+        error = None
+        with tracing.span("readiness.poll", instance_id=target.instance_id, attempt=attempts):
+            for probe in probes:
+                remaining = max(deadline - clock.monotonic(), 0.01)
+                try:
+                    with tracing.span(f"probe.{probe.name}"):
+                        await asyncio.wait_for(probe.check(target), clock.real(min(probe.timeout, remaining)))
+                except asyncio.TimeoutError:
+                    error = f"{probe.name} probe timed out"
+                    break
+                except Exception as e:
+                    error = f"{probe.name} probe failed: {e}"
+                    break
+
+        if on_attempt:
+            on_attempt(target.instance_id, attempts, error)
+
+        elapsed = clock.monotonic() - start
+        if error is None:
+            return ProbeResult(target.instance_id, True, elapsed, attempts, target.instance)
+        if clock.monotonic() + interval >= deadline:
+            return ProbeResult(target.instance_id, False, elapsed, attempts, target.instance, error)
+        await clock.async_sleep(interval)
+
+
+async def wait_ready_many(instances, probes, timeout=60.0, interval=1.0, concurrency=200, on_attempt=None):
+    """
+    Wait for many instances concurrently from a single event loop.
+
+    Args:
+        instances (list): Instance objects to probe
+        probes (list): Probe objects shared by every instance
+        timeout (float): Per-instance deadline in seconds
+        interval (float): Delay between attempts in seconds
+        concurrency (int): Maximum number of instances probed at once
+        on_attempt (callable, optional): Passed through to wait_ready
+
+    Returns:
+        List of ProbeResult objects in the same order as instances
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _wait(instance):
+        async with semaphore:
+            return await wait_ready(instance, probes, timeout, interval, on_attempt)
+
+    return await asyncio.gather(*(_wait(instance) for instance in instances))
+
+
+def wait_for_instances(instances, probes, timeout=60.0, interval=1.0, concurrency=200, on_attempt=None):
+    """
+    Synchronous wrapper around wait_ready_many for non-async callers.
+
+    Returns:
+        List of ProbeResult objects in the same order as instances
+    """
+    return asyncio.run(wait_ready_many(instances, probes, timeout, interval, concurrency, on_attempt))
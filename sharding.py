@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+
+# Fan a test suite out over ephemeral instances started from one snapshot.
+# Tests are split into shards balanced by durations recorded in earlier runs,
+# each shard runs on its own instance with output streamed back as it is
+# produced, and the per-shard JUnit/JSON reports are merged locally.
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import json
+import os
+import shlex
+import statistics
+import threading
+import time
+import xml.etree.ElementTree as ET
+
+import tracing
+
+DEFAULT_HISTORY_FILE = os.environ.get('MORPH_TEST_DURATIONS', 'data/test_durations.json')
+DEFAULT_TEST_DURATION = 1.0
+REMOTE_REPORT_PATH = '/tmp/morph-shard-report'
+
+_print_lock = threading.Lock()
+
+
+def _emit(line):
+    with _print_lock:
+        print(line, flush=True)
+
+
+class DurationHistory:
+    """
+    Per-test durations from previous runs, kept in a local JSON file.
+    New measurements are blended with the old ones so a single slow run does not dominate.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or DEFAULT_HISTORY_FILE
+        self.durations = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.durations = json.load(f)
+
+    def estimate(self, test):
+        if test in self.durations:
+            return self.durations[test]
+        if self.durations:
+            return statistics.median(self.durations.values())
+        return DEFAULT_TEST_DURATION
+
+    def update(self, measured, weight=0.5):
+        for test, duration in measured.items():
+            previous = self.durations.get(test)
+            self.durations[test] = duration if previous is None else previous * (1 - weight) + duration * weight
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, 'w') as f:
+            json.dump(self.durations, f, indent=1, sort_keys=True)
+
+
+def split_tests(tests, shards, history):
+    """
+    Split tests into shards with similar predicted durations
+    (longest-processing-time-first greedy assignment).
+
+    Args:
+        tests (list): Test identifiers
+        shards (int): Number of shards
+        history (DurationHistory): Source of per-test estimates
+
+    Returns:
+        List of (tests, predicted_seconds) tuples, one per shard
+    """
+    buckets = [([], 0.0) for _ in range(shards)]
+    for test in sorted(tests, key=history.estimate, reverse=True):
+        index = min(range(shards), key=lambda i: buckets[i][1])
+        assigned, load = buckets[index]
+        assigned.append(test)
+        buckets[index] = (assigned, load + history.estimate(test))
+    return buckets
+
+
+def build_command(template, tests, report_path):
+    """
+    Fill in {tests} and {report} in the test command.
+    Tests are appended when the template has no {tests} placeholder.
+
+    Args:
+        template (str or list): A shell snippet, or an argv list that is quoted
+            argument by argument after substitution
+        tests (list): Test IDs of the shard
+        report_path (str): Remote report path
+
+    Returns:
+        The command line to run in the remote shell
+    """
+    if isinstance(template, str):
+        quoted = ' '.join(shlex.quote(test) for test in tests)
+        command = template.replace('{report}', report_path)
+        if '{tests}' in command:
+            return command.replace('{tests}', quoted)
+        return f"{command} {quoted}"
+
+    argv = []
+    for arg in template:
+        if arg == '{tests}':
+            # A bare placeholder expands to one argument per test
+            argv.extend(tests)
+        else:
+            argv.append(arg.replace('{report}', report_path).replace('{tests}', ' '.join(tests)))
+    if not any('{tests}' in arg for arg in template):
+        argv.extend(tests)
+    return shlex.join(argv)
+
+
+def command_template(argv):
+    """
+    Turn the argv given after -- into a build_command template: a single argument
+    is a shell snippet used as is, several arguments are kept as an argv list.
+    """
+    return argv[0] if len(argv) == 1 else list(argv)
+
+
+def _normalize(test):
+    """Map a test ID or path to a dotted name comparable with JUnit classname.name"""
+    name = test.replace('::', '.').replace('/', '.')
+    return name[:-3] if name.endswith('.py') else name.replace('.py.', '.')
+
+
+def measured_durations(tests, report, report_format, fallback_seconds):
+    """
+    Per-test durations from a shard report, falling back to an even split of the shard's wall time.
+
+    Returns:
+        Dict of test ID to seconds
+    """
+    durations = {}
+    if report and report_format == 'junit':
+        root = ET.fromstring(report)
+        normalized = {test: _normalize(test) for test in tests}
+        for case in root.iter('testcase'):
+            full = f"{case.get('classname', '')}.{case.get('name', '')}"
+            for test, prefix in normalized.items():
+                if full == prefix or full.startswith(prefix + '.') or full.endswith('.' + prefix):
+                    durations[test] = durations.get(test, 0.0) + float(case.get('time', 0) or 0)
+                    break
+    elif report and report_format == 'json':
+        data = json.loads(report)
+        for entry in data.get('tests', []) if isinstance(data, dict) else data:
+            nodeid = entry.get('nodeid') or entry.get('name')
+            duration = entry.get('duration')
+            if duration is None:
+                duration = sum(entry.get(phase, {}).get('duration', 0) for phase in ('setup', 'call', 'teardown'))
+            for test in tests:
+                if nodeid == test or str(nodeid).startswith(test.rstrip('/') + '::'):
+                    durations[test] = durations.get(test, 0.0) + float(duration or 0)
+                    break
+    missing = [test for test in tests if test not in durations]
+    if missing:
+        # Spread whatever wall time the report did not account for over the unmatched tests
+        share = max(fallback_seconds - sum(durations.values()), 0.0) / len(missing)
+        for test in missing:
+            durations[test] = share
+    return durations
+
+
+def merge_junit(reports):
+    """Merge JUnit XML documents into one <testsuites> document"""
+    merged = ET.Element('testsuites')
+    totals = {'tests': 0, 'failures': 0, 'errors': 0, 'skipped': 0}
+    total_time = 0.0
+    for report in reports:
+        root = ET.fromstring(report)
+        suites = [root] if root.tag == 'testsuite' else list(root.iter('testsuite'))
+        for suite in suites:
+            merged.append(suite)
+            for key in totals:
+                totals[key] += int(suite.get(key, 0) or 0)
+            total_time += float(suite.get('time', 0) or 0)
+    for key, value in totals.items():
+        merged.set(key, str(value))
+    merged.set('time', f"{total_time:.3f}")
+    return ET.tostring(merged, encoding='unicode')
+
+
+def merge_json(reports):
+    """Merge JSON reports: lists are concatenated, pytest-json-report style {'tests': [...]} documents combined"""
+    tests = []
+    summary = {}
+    for report in reports:
+        data = json.loads(report)
+        if isinstance(data, list):
+            tests.extend(data)
+            continue
+        tests.extend(data.get('tests', []))
+        for key, value in (data.get('summary') or {}).items():
+            if isinstance(value, (int, float)):
+                summary[key] = summary.get(key, 0) + value
+    return json.dumps({'summary': summary, 'tests': tests}, indent=1)
+
+
+class ShardResult:
+    """Outcome of one shard"""
+
+    def __init__(self, index, tests, predicted):
+        self.index = index
+        self.tests = tests
+        self.predicted = predicted
+        self.instance_id = None
+        self.exit_code = None
+        self.elapsed = 0.0
+        self.report = None
+        self.error = None
+
+
+class ShardRunner:
+    """
+    Starts the shard instances, runs the shards and tears everything down.
+    """
+
+    def __init__(self, manager, snapshot_id, shards, command, tests, report_format=None,
+                 history=None, ready_timeout=300, keep=False):
+        self.manager = manager
+        self.snapshot_id = snapshot_id
+        self.shards = shards
+        self.command = command
+        self.tests = tests
+        self.report_format = report_format
+        self.history = history or DurationHistory()
+        self.ready_timeout = ready_timeout
+        self.keep = keep
+        self.instances = []
+
+    def _start_instances(self):
+        self.instances = self.manager.start_instances(self.snapshot_id, self.shards)
+        _emit(f"[shard-run] Started {len(self.instances)}/{self.shards} instances, waiting for SSH...")
+        results = self.manager.wait_until_ready_many(self.instances, wait_for='ssh', timeout=self.ready_timeout)
+        ready = [result.instance for result in results if result.ok]
+        for result in results:
+            if not result.ok:
+                _emit(f"[shard-run] {result.instance_id} not ready: {result.error}")
+        return ready
+
+    def _run_streaming(self, instance, command, prefix):
+        """Run a command over SSH and print its output line by line as it arrives"""
+        ssh = instance.ssh_connect()
+        try:
+            _, stdout, _ = ssh.exec_command(command, get_pty=True)
+            for line in iter(stdout.readline, ''):
+                _emit(f"{prefix} {line.rstrip()}")
+            return stdout.channel.recv_exit_status()
+        finally:
+            ssh.close()
+
+    def _run_shard(self, shard, instance):
+        prefix = f"[shard {shard.index}]"
+        report_path = f"{REMOTE_REPORT_PATH}-{shard.index}"
+        command = build_command(self.command, shard.tests, report_path)
+        shard.instance_id = instance.id
+        _emit(f"{prefix} {len(shard.tests)} tests on {instance.id} (predicted {shard.predicted:.1f}s)")
+
+        started = time.monotonic()
+        with tracing.span("shard.run", shard=shard.index, instance_id=instance.id):
+            if hasattr(instance, 'ssh_connect'):
+                shard.exit_code = self._run_streaming(instance, command, prefix)
+            else:
+                result = instance.exec(command)
+                for line in (getattr(result, 'stdout', '') or '').splitlines():
+                    _emit(f"{prefix} {line}")
+                shard.exit_code = result.exit_code
+        shard.elapsed = time.monotonic() - started
+
+        if self.report_format:
+            result = instance.exec(f"cat {shlex.quote(report_path)}")
+            if getattr(result, 'exit_code', 1) == 0 and result.stdout.strip():
+                shard.report = result.stdout
+            else:
+                _emit(f"{prefix} no report found at {report_path}")
+        _emit(f"{prefix} finished with exit code {shard.exit_code} in {shard.elapsed:.1f}s")
+        return shard
+
+    def _stop(self, instance):
+        instance.stop()
+        self.manager._forget(instance.id)
+
+    def _teardown(self):
+        if self.keep:
+            _emit(f"[shard-run] Keeping instances: {', '.join(instance.id for instance in self.instances)}")
+            return
+        with tracing.span("shard.teardown", count=len(self.instances)):
+            with ThreadPoolExecutor(max_workers=max(1, len(self.instances))) as executor:
+                for instance in self.instances:
+                    executor.submit(self._stop, instance)
+        _emit(f"[shard-run] Stopped {len(self.instances)} instances")
+
+    @tracing.traced("ShardRunner.run")
+    def run(self):
+        """
+        Returns:
+            List of ShardResult objects
+        """
+        plan = split_tests(self.tests, self.shards, self.history)
+        shards = [ShardResult(index, tests, predicted) for index, (tests, predicted) in enumerate(plan) if tests]
+
+        try:
+            ready = self._start_instances()
+            if not ready:
+                raise RuntimeError("no shard instance became ready")
+            if len(ready) < len(shards):
+                # Fewer machines than planned: re-balance over what is available
+                plan = split_tests(self.tests, len(ready), self.history)
+                shards = [ShardResult(index, tests, predicted) for index, (tests, predicted) in enumerate(plan) if tests]
+
+            with ThreadPoolExecutor(max_workers=len(shards)) as executor:
+                futures = {executor.submit(tracing.bind_context(self._run_shard), shard, instance): shard
+                           for shard, instance in zip(shards, ready)}
+                for future in as_completed(futures):
+                    shard = futures[future]
+                    try:
+                        future.result()
+                    except Exception as e:
+                        shard.error = str(e)
+                        _emit(f"[shard {shard.index}] Error: {e}")
+        finally:
+            self._teardown()
+
+        for shard in shards:
+            if shard.exit_code is not None:
+                self.history.update(measured_durations(shard.tests, shard.report, self.report_format, shard.elapsed))
+        self.history.save()
+        return shards
+
+
+def merge_reports(shards, report_format, output_path):
+    """Write the merged report of all shards to output_path"""
+    reports = [shard.report for shard in shards if shard.report]
+    if not reports:
+        return None
+    merged = merge_junit(reports) if report_format == 'junit' else merge_json(reports)
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(output_path, 'w') as f:
+        f.write(merged)
+    return output_path
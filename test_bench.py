@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+# Exercises the bench-shapes harness end to end against the simulated backend.
+
+from bench import FakeMorphClient, ShapeBench, confidence_interval, parse_grid
+from ledger import Ledger
+from morph_cloud import MorphCloudManager
+
+
+def test_parse_grid_expands_every_combination():
+    shapes = parse_grid('1,2', '2048,4096', '20000')
+    assert [(shape.vcpus, shape.memory, shape.disk_size) for shape in shapes] == [
+        (1, 2048, 20000), (1, 4096, 20000), (2, 2048, 20000), (2, 4096, 20000)]
+
+
+def test_confidence_interval():
+    assert confidence_interval([]) == (None, None)
+    assert confidence_interval([2.0]) == (2.0, None)
+    mean, half_width = confidence_interval([1.0, 2.0, 3.0])
+    # t(0.975, df=2) * stdev / sqrt(n) = 4.303 * 1.0 / sqrt(3)
+    assert mean == 2.0
+    assert abs(half_width - 4.303 / 3 ** 0.5) < 1e-9
+
+
+def test_shape_bench_on_fake_backend_cleans_up():
+    client = FakeMorphClient(speed=50, seed=1)
+    try:
+        manager = MorphCloudManager(client=client)
+        manager._ledger = Ledger(':memory:')
+        runner = ShapeBench(manager, parse_grid('1,4', '2048', '20000'), runs=3, workload='work',
+                            timeout=30, interval=0.01, ssh_endpoint=client.ssh_endpoint)
+        samples = runner.run()
+
+        assert len(samples) == 6
+        assert all(sample.error is None for sample in samples)
+        assert all(0 < sample.running <= sample.ssh for sample in samples)
+        rows = {row['shape'].vcpus: row for row in runner.summary()}
+        assert rows[1]['ok'] == rows[4]['ok'] == 3
+        # The simulated workload is CPU-bound, so more vCPUs finish sooner
+        assert rows[4]['workload'][0] < rows[1]['workload'][0]
+
+        assert client.snapshots.list() == []
+        assert client.instances.list() == []
+        assert manager.ledger.active() == []
+    finally:
+        client.close()
+
+
+def test_fake_samples_are_not_quantized_to_the_poll_grid():
+    client = FakeMorphClient(speed=5, seed=2)
+    try:
+        manager = MorphCloudManager(client=client)
+        manager._ledger = Ledger(':memory:')
+        runner = ShapeBench(manager, parse_grid('1', '2048', '20000'), runs=5, timeout=30, interval=0.1,
+                            ssh_endpoint=client.ssh_endpoint)
+        samples = runner.run()
+
+        assert len({round(sample.running, 3) for sample in samples}) > 1
+        assert len({round(sample.ssh, 3) for sample in samples}) > 1
+        # Never report more precision than the polling can give
+        row = runner.summary()[0]
+        assert row['running'][1] >= runner.resolution and row['ssh'][1] >= runner.resolution
+    finally:
+        client.close()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+
+# Orphan classification of ledger entries against one account listing.
+
+import time
+import types
+
+from ledger import Ledger, find_orphans
+
+
+def _instance(instance_id, snapshot_id, status='running'):
+    return types.SimpleNamespace(id=instance_id, status=status, refs=types.SimpleNamespace(snapshot_id=snapshot_id))
+
+
+def _snapshot(snapshot_id):
+    return types.SimpleNamespace(id=snapshot_id)
+
+
+def _ids(entries):
+    return sorted(entry['id'] for entry in entries)
+
+
+def test_find_orphans_classification():
+    ledger = Ledger(':memory:')
+    ledger.record('snapshot', 's1')
+    ledger.record('instance', 'i1', parent_id='s1')
+    ledger.record('snapshot', 's2', parent_id='i1')   # intermediate, only child stopped
+    ledger.record('instance', 'i2', parent_id='s2')
+    ledger.record('snapshot', 's3', parent_id='i1')   # intermediate with a running child
+    ledger.record('instance', 'i3', parent_id='s3')
+    ledger.record('instance', 'gone', parent_id='s1')
+    instances = [_instance('i1', 's1'), _instance('i2', 's2', status='stopped'), _instance('i3', 's3'),
+                 _instance('x1', 's1')]
+    snapshots = [_snapshot('s1'), _snapshot('s2'), _snapshot('s3'), _snapshot('x2')]
+
+    report = find_orphans(ledger, instances, snapshots)
+
+    assert _ids(report.leaked) == ['s2']
+    assert _ids(report.tracked) == ['i1', 'i2', 'i3', 's1', 's3']
+    assert _ids(report.vanished) == ['gone']
+    assert sorted(resource.id for _, resource in report.unknown) == ['x1', 'x2']
+    assert ledger.get('gone')['deleted'] is not None
+
+
+def test_find_orphans_age_applies_to_instances_only():
+    ledger = Ledger(':memory:')
+    ledger.record('snapshot', 'base')
+    ledger.record('instance', 'old', parent_id='base')
+    time.sleep(0.01)
+
+    report = find_orphans(ledger, [_instance('old', 'base')], [_snapshot('base')], max_age_hours=0)
+
+    assert _ids(report.leaked) == ['old']
+    assert _ids(report.tracked) == ['base']
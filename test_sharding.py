@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+
+# Building the per-shard remote command from what was given after "--".
+
+import shlex
+
+from sharding import build_command, command_template
+
+TESTS = ['tests/test_a.py::t1', 'tests/b.py']
+
+
+def test_single_argument_is_a_shell_snippet():
+    template = command_template(['cd /app && pytest -q --junitxml={report} {tests}'])
+    command = build_command(template, TESTS, '/tmp/r-0')
+    assert command == 'cd /app && pytest -q --junitxml=/tmp/r-0 tests/test_a.py::t1 tests/b.py'
+    assert shlex.split(command)[:3] == ['cd', '/app', '&&']
+
+
+def test_argv_keeps_quoting_and_expands_bare_tests():
+    template = command_template(['pytest', '-k', 'a and b', '--junitxml={report}', '{tests}'])
+    command = build_command(template, TESTS, '/tmp/r-0')
+    assert shlex.split(command) == ['pytest', '-k', 'a and b', '--junitxml=/tmp/r-0'] + TESTS
+
+
+def test_argv_embedded_tests_placeholder_stays_one_argument():
+    template = command_template(['pytest', '-k{tests}'])
+    assert shlex.split(build_command(template, ['t1', 't2'], '/tmp/r')) == ['pytest', '-kt1 t2']
+
+
+def test_tests_are_appended_without_placeholder():
+    assert shlex.split(build_command(command_template(['pytest', '-q']), TESTS, '/tmp/r')) == ['pytest', '-q'] + TESTS
+    assert build_command('pytest -q', ["it's"], '/tmp/r') == "pytest -q 'it'\"'\"'s'"
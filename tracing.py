@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+
+# Lightweight OpenTelemetry-style tracing for Morph Cloud operations.
+# Spans nest through contextvars, so the current span follows asyncio tasks
+# automatically and threads that run inside a copied context.
+# Tracing is off (and close to free) until an exporter is configured.
+
+import atexit
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import urllib.request
+import uuid
+
+_current_span = contextvars.ContextVar('morph_current_span', default=None)
+_exporters = []
+_lock = threading.Lock()
+
+
+class Span:
+    """
+    A timed operation within a trace.
+    """
+
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = dict(attributes or {})
+        self.start = time.time()
+        self.end = None
+        self.status = 'ok'
+        self.error = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    @property
+    def duration(self):
+        return (self.end or time.time()) - self.start
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'start': self.start,
+            'end': self.end,
+            'duration_ms': round(self.duration * 1000, 3),
+            'status': self.status,
+            'error': self.error,
+            'attributes': self.attributes,
+            'thread': threading.current_thread().name,
+        }
+
+    def to_otlp(self):
+        """The span in OTLP/JSON form, as accepted by a collector's /v1/traces endpoint"""
+        attributes = dict(self.attributes, **{'thread.name': threading.current_thread().name})
+        span = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': 1,  # SPAN_KIND_INTERNAL
+            'startTimeUnixNano': str(int(self.start * 1e9)),
+            'endTimeUnixNano': str(int((self.end or time.time()) * 1e9)),
+            'attributes': _otlp_attributes(attributes),
+            'status': {'code': 2, 'message': self.error or ''} if self.status == 'error' else {'code': 1},
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        return span
+
+
+def _otlp_attributes(attributes):
+    """Convert a flat dict to an OTLP KeyValue list"""
+    values = []
+    for key, value in attributes.items():
+        if isinstance(value, bool):
+            value = {'boolValue': value}
+        elif isinstance(value, int):
+            # int64 values are strings in OTLP/JSON
+            value = {'intValue': str(value)}
+        elif isinstance(value, float):
+            value = {'doubleValue': value}
+        else:
+            value = {'stringValue': str(value)}
+        values.append({'key': str(key), 'value': value})
+    return values
+
+
+class FileExporter:
+    """
+    Append finished spans to a file as JSON lines.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def export(self, span):
+        line = json.dumps(span.to_dict(), default=str)
+        with _lock:
+            with open(self.path, 'a') as f:
+                f.write(line + '\n')
+
+    def flush(self):
+        pass
+
+
+class OtlpHttpExporter:
+    """
+    Batch finished spans and POST them as OTLP/JSON to a collector's traces
+    endpoint (for example http://localhost:4318/v1/traces).
+    """
+
+    def __init__(self, endpoint, batch_size=100, timeout=5.0):
+        self.endpoint = endpoint
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self._buffer = []
+
+    def export(self, span):
+        with _lock:
+            self._buffer.append(span.to_otlp())
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self.flush()
+
+    def flush(self):
+        with _lock:
+            batch, self._buffer = self._buffer, []
+        if not batch:
+            return
+        body = json.dumps({'resourceSpans': [{
+            'resource': {'attributes': _otlp_attributes({'service.name': 'morph-cloud-manager'})},
+            'scopeSpans': [{'scope': {'name': 'morph-cloud-manager'}, 'spans': batch}],
+        }]})
+        request = urllib.request.Request(self.endpoint, data=body.encode(),
+                                         headers={'Content-Type': 'application/json'})
+        try:
+            urllib.request.urlopen(request, timeout=self.timeout).close()
+        except Exception as e:
+            print(f"Warning: could not export {len(batch)} spans to {self.endpoint}: {e}")
+
+
+def configure(trace_file=None, otlp_endpoint=None):
+    """
+    Enable tracing with the given exporters.
+
+    Falls back to MORPH_TRACE_FILE and MORPH_TRACE_OTLP_ENDPOINT when arguments are omitted.
+
+    Args:
+        trace_file (str, optional): Path of a JSON-lines span file
+        otlp_endpoint (str, optional): URL spans are POSTed to in batches
+    """
+    trace_file = trace_file or os.environ.get('MORPH_TRACE_FILE')
+    otlp_endpoint = otlp_endpoint or os.environ.get('MORPH_TRACE_OTLP_ENDPOINT')
+    if trace_file:
+        _exporters.append(FileExporter(trace_file))
+    if otlp_endpoint:
+        _exporters.append(OtlpHttpExporter(otlp_endpoint))
+
+
+def enabled():
+    return bool(_exporters)
+
+
+def flush():
+    """Flush buffered spans in every exporter"""
+    for exporter in _exporters:
+        exporter.flush()
+
+
+atexit.register(flush)
+
+
+class _SpanContext:
+    """Context manager that activates a span and exports it when it ends"""
+
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = attributes
+        self.span = None
+        self._token = None
+
+    def __enter__(self):
+        if not _exporters:
+            return None
+        self.span = Span(self.name, _current_span.get(), self.attributes)
+        self._token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.span is None:
+            return False
+        self.span.end = time.time()
+        if exc is not None:
+            self.span.status = 'error'
+            self.span.error = f"{exc_type.__name__}: {exc}"
+        _current_span.reset(self._token)
+        for exporter in _exporters:
+            exporter.export(self.span)
+        return False
+
+
+def span(name, **attributes):
+    """
+    Start a child of the current span (or a new trace).
+
+    Usage:
+        with tracing.span("poll", attempt=3) as s:
+            ...
+
+    The context manager yields None when tracing is disabled.
+    """
+    return _SpanContext(name, attributes)
+
+
+def traced(name=None):
+    """
+    Decorator wrapping every call of a function in a span.
+
+    Args:
+        name (str, optional): Span name; defaults to the function's qualified name
+    """
+    def decorator(fn):
+        span_name = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _exporters:
+                return fn(*args, **kwargs)
+            with span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def bind_context(fn):
+    """
+    Return fn bound to a copy of the current context, so spans it starts in
+    another thread are children of the caller's span.
+    """
+    context = contextvars.copy_context()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        # A context can only be entered by one thread at a time, so each call gets its own copy
+        return context.copy().run(fn, *args, **kwargs)
+    return wrapper
+
+
+class _TracedResource:
+    """Proxy around client.snapshots / client.instances that spans each method call"""
+
+    def __init__(self, resource, prefix):
+        self.__wrapped__ = resource
+        self._prefix = prefix
+
+    def __getattr__(self, attr):
+        value = getattr(self.__wrapped__, attr)
+        if attr.startswith('_') or not callable(value):
+            return value
+
+        span_name = f"{self._prefix}.{attr}"
+
+        @functools.wraps(value)
+        def wrapper(*args, **kwargs):
+            if not _exporters:
+                return value(*args, **kwargs)
+            attributes = {key: str(arg) for key, arg in kwargs.items()}
+            with span(span_name, **attributes) as s:
+                result = value(*args, **kwargs)
+                if s is not None and hasattr(result, 'id'):
+                    s.set_attribute('result.id', result.id)
+                return result
+        return wrapper
+
+
+class TracedClient:
+    """
+    Proxy around a MorphCloudClient whose snapshots/instances calls become child spans.
+    The underlying client is available as __wrapped__.
+    """
+
+    RESOURCES = ('snapshots', 'instances')
+
+    def __init__(self, client):
+        self.__wrapped__ = client
+
+    def __getattr__(self, attr):
+        value = getattr(self.__wrapped__, attr)
+        if attr in self.RESOURCES:
+            return _TracedResource(value, f"client.{attr}")
+        return value
+
+
+def instrument_client(client):
+    """
+    Wrap a MorphCloudClient so its API calls are traced. Safe to call twice.
+
+    Returns:
+        A TracedClient
+    """
+    if isinstance(client, TracedClient):
+        return client
+    return TracedClient(client)
+
+
+def load_spans(path):
+    """
+    Read spans written by FileExporter.
+
+    Returns:
+        List of span dicts
+    """
+    spans = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                spans.append(json.loads(line))
+    return spans
+
+
+def print_report(path, limit=5, min_ms=0.0):
+    """
+    Print the slowest traces in a span file as indented trees.
+
+    Args:
+        path (str): Span file written by FileExporter
+        limit (int): Number of traces to show
+        min_ms (float): Hide child spans shorter than this many milliseconds
+    """
+    spans = load_spans(path)
+    children = {}
+    roots = []
+    for s in spans:
+        if s['parent_id']:
+            children.setdefault(s['parent_id'], []).append(s)
+        else:
+            roots.append(s)
+
+    roots.sort(key=lambda s: s['duration_ms'], reverse=True)
+    print(f"{len(spans)} spans in {len(roots)} traces; showing the {min(limit, len(roots))} slowest")
+
+    def _print(s, depth, total):
+        share = (s['duration_ms'] / total * 100) if total else 0
+        marker = ' !' if s['status'] == 'error' else ''
+        print(f"{'  ' * depth}{s['name']}: {s['duration_ms']:.1f} ms ({share:.0f}%){marker}")
+        for child in sorted(children.get(s['span_id'], []), key=lambda c: c['start']):
+            if child['duration_ms'] >= min_ms:
+                _print(child, depth + 1, total)
+
+    for root in roots[:limit]:
+        print(f"\nTrace {root['trace_id']}")
+        _print(root, 1, root['duration_ms'])
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+
+# Port forwarding to Morph Cloud instances from a single event loop.
+# Each instance gets one SSH transport; every forwarded connection to that
+# instance is a separate direct-tcpip channel multiplexed over it. When the
+# transport drops (for example because the instance restarted) it is
+# re-established and new connections wait for it instead of failing.
+
+import asyncio
+import time
+
+import paramiko
+
+import readiness
+import tracing
+
+DEFAULT_BIND = '127.0.0.1'
+CHUNK_SIZE = 65536
+# Seconds between checks while an SSH channel's send window is full
+SEND_BACKOFF = 0.005
+
+
+class Forward:
+    """
+    One local port forwarded to a port on an instance, with its statistics.
+    """
+
+    def __init__(self, instance_id, local_port, remote_port, remote_host='localhost', bind=DEFAULT_BIND):
+        self.instance_id = instance_id
+        self.local_port = local_port
+        self.remote_port = remote_port
+        self.remote_host = remote_host
+        self.bind = bind
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.connections = 0
+        self.active = 0
+        self.failures = 0
+        self.open_latencies = []
+
+    @classmethod
+    def parse(cls, spec, bind=DEFAULT_BIND):
+        """
+        Parse INSTANCE:LOCAL_PORT:REMOTE_PORT or INSTANCE:LOCAL_PORT:REMOTE_HOST:REMOTE_PORT.
+        """
+        parts = spec.split(':')
+        if len(parts) == 3:
+            instance_id, local_port, remote_port = parts
+            return cls(instance_id, int(local_port), int(remote_port), bind=bind)
+        if len(parts) == 4:
+            instance_id, local_port, remote_host, remote_port = parts
+            return cls(instance_id, int(local_port), int(remote_port), remote_host, bind=bind)
+        raise ValueError(f"Invalid forward specification: {spec} (expected INSTANCE:LOCAL:[HOST:]REMOTE)")
+
+    @property
+    def label(self):
+        return f"{self.bind}:{self.local_port} -> {self.instance_id}:{self.remote_host}:{self.remote_port}"
+
+    def latency_summary(self):
+        """Return (average, p95) channel-open latency in milliseconds"""
+        if not self.open_latencies:
+            return 0.0, 0.0
+        ordered = sorted(self.open_latencies)
+        p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+        return sum(ordered) / len(ordered) * 1000, p95 * 1000
+
+
+class InstanceTransport:
+    """
+    The shared SSH transport for one instance, reconnected on demand.
+    """
+
+    def __init__(self, client, instance_id, keepalive=15):
+        self.client = client
+        self.instance_id = instance_id
+        self.keepalive = keepalive
+        self.reconnects = 0
+        self._ssh = None
+        self._transport = None
+        self._lock = asyncio.Lock()
+
+    def _connect(self):
+        instance = self.client.instances.get(instance_id=self.instance_id)
+        if hasattr(instance, 'ssh_connect'):
+            ssh = instance.ssh_connect()
+        else:
+            ssh = paramiko.SSHClient()
+            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            ssh.connect(readiness.DEFAULT_SSH_HOST, port=readiness.DEFAULT_SSH_PORT,
+                        username=self.instance_id, password=getattr(self.client, 'api_key', None))
+        transport = ssh.get_transport()
+        transport.set_keepalive(self.keepalive)
+        return ssh, transport
+
+    @property
+    def active(self):
+        return self._transport is not None and self._transport.is_active()
+
+    async def ensure(self, timeout=120):
+        """
+        Connect, or reconnect after the instance restarted, waiting for SSH readiness first.
+        """
+        async with self._lock:
+            if self.active:
+                return self._transport
+            if self._ssh is not None:
+                self._ssh.close()
+                self.reconnects += 1
+                print(f"[tunnel] {self.instance_id}: transport lost, reconnecting...")
+
+            with tracing.span("tunnel.connect", instance_id=self.instance_id):
+                instance = await asyncio.to_thread(self.client.instances.get, instance_id=self.instance_id)
+                result = await readiness.wait_ready(instance, readiness.probes_for('ssh', self.client), timeout=timeout)
+                if not result.ok:
+                    raise ConnectionError(f"{self.instance_id} not SSH-ready: {result.error}")
+                self._ssh, self._transport = await asyncio.to_thread(self._connect)
+            print(f"[tunnel] {self.instance_id}: SSH transport established")
+            return self._transport
+
+    async def open_channel(self, forward, peer):
+        transport = await self.ensure()
+        try:
+            return await asyncio.to_thread(transport.open_channel, 'direct-tcpip',
+                                           (forward.remote_host, forward.remote_port), peer)
+        except (paramiko.SSHException, EOFError):
+            # The transport died between the check and the open; reconnect once
+            transport = await self.ensure()
+            return await asyncio.to_thread(transport.open_channel, 'direct-tcpip',
+                                           (forward.remote_host, forward.remote_port), peer)
+
+    def close(self):
+        if self._ssh is not None:
+            self._ssh.close()
+
+
+class TunnelManager:
+    """
+    Runs many forwards across many instances in one event loop.
+    """
+
+    def __init__(self, client, forwards, report_interval=30, health_interval=10):
+        self.client = client
+        self.forwards = list(forwards)
+        self.report_interval = report_interval
+        self.health_interval = health_interval
+        self.transports = {}
+        for forward in self.forwards:
+            if forward.instance_id not in self.transports:
+                self.transports[forward.instance_id] = InstanceTransport(client, forward.instance_id)
+        self._servers = []
+        self._started = time.monotonic()
+
+    async def _pump_channel_to_stream(self, channel, writer, forward):
+        """Copy channel data to the local socket, woken by the channel's selectable fd"""
+        loop = asyncio.get_running_loop()
+        readable = asyncio.Event()
+        fd = channel.fileno()
+        loop.add_reader(fd, readable.set)
+        try:
+            while True:
+                await readable.wait()
+                readable.clear()
+                if channel.recv_ready():
+                    data = channel.recv(CHUNK_SIZE)
+                elif channel.closed or channel.eof_received:
+                    data = b''
+                else:
+                    continue
+                if not data:
+                    break
+                forward.bytes_in += len(data)
+                writer.write(data)
+                # The fd stays readable while data waits, so a level-triggered reader
+                # would spin the loop for as long as a slow client keeps drain() blocked
+                loop.remove_reader(fd)
+                try:
+                    await writer.drain()
+                finally:
+                    loop.add_reader(fd, readable.set)
+        finally:
+            loop.remove_reader(fd)
+
+    async def _pump_stream_to_channel(self, reader, channel, forward):
+        """Copy local data to the channel without blocking a thread on a full SSH window"""
+        while True:
+            data = await reader.read(CHUNK_SIZE)
+            if not data:
+                break
+            forward.bytes_out += len(data)
+            while data:
+                if channel.closed:
+                    raise EOFError("channel closed")
+                if not channel.send_ready():
+                    # Remote window is full; back off instead of parking a worker thread
+                    await asyncio.sleep(SEND_BACKOFF)
+                    continue
+                data = data[channel.send(data):]
+        channel.shutdown_write()
+
+    async def _handle(self, forward, reader, writer):
+        peer = writer.get_extra_info('peername') or ('127.0.0.1', 0)
+        forward.connections += 1
+        forward.active += 1
+        transport = self.transports[forward.instance_id]
+        try:
+            started = time.monotonic()
+            channel = await transport.open_channel(forward, peer[:2])
+            forward.open_latencies.append(time.monotonic() - started)
+            # Keep the latency sample bounded for long-running tunnels
+            del forward.open_latencies[:-1000]
+        except Exception as e:
+            forward.failures += 1
+            forward.active -= 1
+            print(f"[tunnel] {forward.label}: could not open channel: {e}")
+            writer.close()
+            return
+
+        download = asyncio.create_task(self._pump_channel_to_stream(channel, writer, forward))
+        upload = asyncio.create_task(self._pump_stream_to_channel(reader, channel, forward))
+        try:
+            await asyncio.wait([download, upload], return_when=asyncio.FIRST_COMPLETED)
+            if download.done() and channel.closed:
+                # The remote end is gone, so nothing more can be sent
+                upload.cancel()
+            else:
+                # Half-close: pass the EOF on and keep the other direction open until it ends too
+                if download.done() and writer.can_write_eof():
+                    writer.write_eof()
+                await asyncio.gather(download, upload)
+        except Exception as e:
+            print(f"[tunnel] {forward.label}: connection error: {e}")
+        finally:
+            for task in (download, upload):
+                task.cancel()
+            forward.active -= 1
+            channel.close()
+            writer.close()
+
+    async def _health_loop(self):
+        """Reconnect transports that dropped, so the next connection does not pay for it"""
+        while True:
+            await asyncio.sleep(self.health_interval)
+            # Reconnect concurrently, so one dead instance cannot hold up the others
+            down = [transport for transport in self.transports.values() if not transport.active]
+            results = await asyncio.gather(*(transport.ensure() for transport in down), return_exceptions=True)
+            for transport, result in zip(down, results):
+                if isinstance(result, Exception):
+                    print(f"[tunnel] {transport.instance_id}: reconnect failed: {result}")
+
+    async def _report_loop(self):
+        while True:
+            await asyncio.sleep(self.report_interval)
+            self.report()
+
+    def report(self):
+        """Print per-tunnel throughput and latency"""
+        elapsed = max(time.monotonic() - self._started, 1e-6)
+        print(f"\nTunnel report ({elapsed:.0f}s):")
+        for forward in self.forwards:
+            average, p95 = forward.latency_summary()
+            rate = (forward.bytes_in + forward.bytes_out) / elapsed / 1024
+            print(f"  {forward.label}: {forward.active} active / {forward.connections} total, "
+                  f"{forward.failures} failed, in {forward.bytes_in} B, out {forward.bytes_out} B "
+                  f"({rate:.1f} KiB/s), open latency avg {average:.1f} ms p95 {p95:.1f} ms")
+        for transport in self.transports.values():
+            state = "up" if transport.active else "down"
+            print(f"  {transport.instance_id}: transport {state}, {transport.reconnects} reconnects")
+
+    async def run(self):
+        """Open all listeners and serve until cancelled"""
+        for forward in self.forwards:
+            server = await asyncio.start_server(
+                lambda reader, writer, forward=forward: self._handle(forward, reader, writer),
+                forward.bind, forward.local_port)
+            self._servers.append(server)
+            print(f"[tunnel] listening {forward.label}")
+
+        # Connect every instance up front, concurrently
+        results = await asyncio.gather(*(transport.ensure() for transport in self.transports.values()),
+                                       return_exceptions=True)
+        for transport, result in zip(self.transports.values(), results):
+            if isinstance(result, Exception):
+                print(f"[tunnel] {transport.instance_id}: initial connect failed: {result}")
+
+        background = [asyncio.create_task(self._health_loop())]
+        if self.report_interval:
+            background.append(asyncio.create_task(self._report_loop()))
+        try:
+            await asyncio.gather(*(server.serve_forever() for server in self._servers))
+        finally:
+            for task in background:
+                task.cancel()
+            for server in self._servers:
+                server.close()
+            for transport in self.transports.values():
+                transport.close()
+            self.report()